@@ -0,0 +1,66 @@
+import numpy as np
+import config
+from catalog import LABS
+
+# Все непустые наборы лабораторий (для трёх — 7), сначала меньшие:
+# при равной сумме выбирается вариант с меньшим числом визитов
+SUBSETS = sorted(
+    (tuple(j for j in range(len(LABS)) if mask >> j & 1) for mask in range(1, 2 ** len(LABS))),
+    key=len,
+)
+
+def visit_fees(visit_fee=None):
+    # Одна плата для всех лабораторий или своя из настроек
+    if visit_fee is not None:
+        return np.full(len(LABS), float(visit_fee))
+    return np.array([config.LAB_VISIT_FEE[lab] for lab in LABS])
+
+def optimize_basket(results, visit_fee=None):
+    """Самый дешёвый способ сдать весь список анализов.
+
+    results — ответ compare_analyses. Возвращает суммы по каждой лаборатории
+    (None, если она делает не все анализы), лучшую одну лабораторию и лучшее
+    разделение списка между лабораториями. В каждую сумму входит плата
+    за визит в каждую задействованную лабораторию. Анализы, цены которых нет
+    ни в одной лаборатории, в расчёт не входят и перечислены в missing.
+    """
+    fees = visit_fees(visit_fee)
+    prices = np.array(
+        [[np.inf if r[lab]["price"] is None else r[lab]["price"] for lab in LABS] for r in results],
+        dtype=float,
+    ).reshape(len(results), len(LABS))
+
+    available = np.isfinite(prices).any(axis=1)
+    missing = [r["user_input"] for r, found in zip(results, available) if not found]
+    names = [r["user_input"] for r, found in zip(results, available) if found]
+    prices = prices[available]
+
+    basket = {"fees": dict(zip(LABS, fees.tolist())), "missing": missing,
+              "labs": dict.fromkeys(LABS), "single": None, "split": None}
+    if not names:
+        return basket
+
+    totals = prices.sum(axis=0) + fees
+    for j, lab in enumerate(LABS):
+        if np.isfinite(totals[j]):
+            basket["labs"][lab] = float(totals[j])
+    if np.isfinite(totals).any():
+        j = int(np.argmin(totals))
+        basket["single"] = {"lab": LABS[j], "total": float(totals[j])}
+
+    # Каждый анализ сдаётся в самой дешёвой лаборатории из набора,
+    # а за каждую лабораторию набора платим один визит
+    best_total, best = np.inf, None
+    for subset in SUBSETS:
+        sub = prices[:, subset]
+        cheapest = sub.min(axis=1)
+        total = cheapest.sum() + fees[list(subset)].sum()
+        if total < best_total:
+            best_total, best = total, (subset, sub)
+
+    subset, sub = best
+    visits = {LABS[j]: [] for j in subset}
+    for name, k in zip(names, sub.argmin(axis=1)):
+        visits[LABS[subset[k]]].append(name)
+    basket["split"] = {"total": float(best_total), "visits": visits}
+    return basket
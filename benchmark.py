@@ -0,0 +1,435 @@
+"""Замеры производительности на синтетических каталогах.
+
+Запуск: python benchmark.py [имя замера ...]
+Настоящие страницы для html_extract: python benchmark.py save_pages [город]
+"""
+import glob
+import itertools
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from catalog import LABS, catalog_cache, catalog_path, load_catalog
+from utils import update_or_add_products
+
+# Сохранённые страницы каталогов (python benchmark.py save_pages)
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_pages")
+
+WORDS = [
+    "анализ", "крови", "мочи", "общий", "клинический", "витамин", "гормон", "антитела",
+    "ферритин", "глюкоза", "холестерин", "тиреотропный", "свободный", "тироксин", "IgG",
+    "IgM", "биохимия", "печеночные", "пробы", "креатинин", "мочевина", "железо", "кальций",
+    "магний", "кортизол", "инсулин", "пролактин", "тестостерон", "эстрадиол", "ПЦР",
+]
+
+QUERIES = [
+    "общий анализ крови", "ттг", "витамин d", "ферритин", "глюкоза", "анализ мочи",
+    "холестерин", "креатинин", "железо", "кортизол", "инсулин", "пролактин",
+    # Анализы, которых нет в каталоге
+    "узи брюшной полости", "mri scan",
+    # Кавычки «» и знаки вроде ° extractOne обрабатывает в запросе иначе, чем в названиях
+    "«чек-ап» комплекс", "витамин «d» 25-oh", "температура 37°",
+]
+
+# Маленькие каталоги, на которых поиск по индексу раньше расходился с extractOne
+REPRO_CATALOGS = [
+    (["комплекс", "комплекс «чек-ап» d крови"], ["«чек-ап» комплекс"]),
+    (["витамин d", "витамин «d» 25-oh (кальцидиол)"], ["«витамин d» 25-oh", "витамин d ±"]),
+]
+
+def make_catalogs(data_dir, city_filename, size=2000, seed=1):
+    rng = random.Random(seed)
+    for lab in LABS:
+        rows = []
+        seen = set()
+        while len(rows) < size:
+            words = rng.sample(WORDS, rng.randint(2, 6))
+            # Часть названий с кавычками, как «Чек-ап» в настоящих каталогах
+            if rng.random() < 0.2:
+                i = rng.randrange(len(words))
+                words[i] = f"«{words[i]}»"
+            title = " ".join(words).capitalize()
+            if title in seen:
+                continue
+            seen.add(title)
+            rows.append({
+                "title": title,
+                "link": f"https://example.test/{lab}/{len(rows)}",
+                "price": f"{rng.randint(150, 9000)} ₽",
+            })
+        update_or_add_products(rows, os.path.join(data_dir, f"{lab}_{city_filename}.csv"))
+
+def measure(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+def report(name, before, after):
+    print(f"{name}: до {before * 1000:.2f} мс, после {after * 1000:.2f} мс, ускорение x{before / after:.1f}")
+
+def bench_catalog_cache(city_filename="бенчмарк", repeat=50):
+    # Подготовка каталогов на один запрос: раньше три read_csv и title_lower каждый раз
+    def cold():
+        for lab in LABS:
+            load_catalog(catalog_path(lab, city_filename))
+
+    def warm():
+        for lab in LABS:
+            catalog_cache.get(lab, city_filename)
+
+    warm()
+    report("Кэш каталогов, загрузка на запрос", measure(cold, repeat), measure(warm, repeat))
+
+def golden_queries(titles, count=40, seed=2):
+    # Названия из каталога с опечатками и сокращениями плюс типичные запросы
+    rng = random.Random(seed)
+    queries = list(QUERIES)
+    for title in rng.sample(titles, count):
+        words = title.split()
+        words = words[:rng.randint(1, len(words))]
+        query = " ".join(words)
+        pos = rng.randrange(len(query))
+        queries.append(query[:pos] + query[pos + 1:])
+    return queries
+
+def bench_title_index(city_filename="бенчмарк", repeat=3):
+    from comparator import find_best_match
+    from matcher import TitleIndex
+
+    for lab in LABS:
+        titles = catalog_cache.get(lab, city_filename).df["title_lower"].tolist()
+        queries = golden_queries(titles)
+        index = TitleIndex(titles)
+
+        start = time.perf_counter()
+        expected = [find_best_match(q, titles) for q in queries]
+        before = (time.perf_counter() - start) / len(queries)
+        actual = [index.extract_one(q) for q in queries]
+        after = measure(lambda: [index.extract_one(q) for q in queries], repeat) / len(queries)
+
+        # При равных оценках extractOne берёт первое по порядку название,
+        # поэтому отдельно считаем ответы с той же оценкой WRatio
+        same = sum(e == a for e, a in zip(expected, actual))
+        same_score = sum(
+            e == a or (e and a and index.score(q, e) == index.score(q, a))
+            for q, e, a in zip(queries, expected, actual)
+        )
+        print(f"{lab}: то же название {same}/{len(queries)}, та же оценка {same_score}/{len(queries)}, "
+              f"{len(titles)} названий")
+        report(f"Поиск названия в {lab}, на запрос", before, after)
+
+    same = total = 0
+    for titles, queries in REPRO_CATALOGS:
+        index = TitleIndex(titles)
+        for q in queries:
+            same += index.extract_one(q) == find_best_match(q, titles)
+            total += 1
+    print(f"Каталоги с кавычками: то же название {same}/{total}")
+
+def bench_batch_compare(city_filename="бенчмарк", repeat=3):
+    from comparator import compare_analyses, find_best_match, normalize_input, result_cache
+
+    catalogs = [catalog_cache.get(lab, city_filename) for lab in LABS]
+    titles = catalogs[0].df["title_lower"].tolist()
+    queries = golden_queries(titles, count=8)
+
+    def per_item():
+        # Прежняя схема: каждый анализ отдельно через extractOne,
+        # строка ищется сравнением всей колонки
+        names = []
+        for user_input in queries:
+            normalized_input = normalize_input(user_input)
+            for catalog in catalogs:
+                match = find_best_match(normalized_input, catalog.df["title_lower"].tolist())
+                names.append(catalog.df[catalog.df["title_lower"] == match].iloc[0]["title"] if match else None)
+        return names
+
+    def batch():
+        result_cache.invalidate()
+        return [result[lab]["name"] for result in compare_analyses(queries, city_filename, []) for lab in LABS]
+
+    expected, actual = per_item(), batch()
+    same = sum(e == a for e, a in zip(expected, actual))
+    print(f"Те же позиции, что у extractOne: {same}/{len(expected)}")
+    report(f"Сравнение списка из {len(queries)} анализов", measure(per_item, repeat), measure(batch, repeat))
+
+def bench_result_cache(city_filename="бенчмарк", repeat=20):
+    from comparator import compare_analyses, result_cache
+
+    titles = catalog_cache.get(LABS[0], city_filename).df["title_lower"].tolist()
+    queries = golden_queries(titles, count=8)
+
+    def cold():
+        result_cache.invalidate()
+        return compare_analyses(queries, city_filename, [])
+
+    def warm():
+        return compare_analyses(queries, city_filename, [])
+
+    same = cold() == warm()
+    print(f"Результаты из кэша совпадают: {same}, {result_cache.stats()}")
+    report(f"Повторное сравнение {len(queries)} анализов", measure(cold, repeat), measure(warm, repeat))
+
+def _basket_results(count, seed):
+    # Результаты сравнения со случайными ценами, часть анализов есть не везде
+    rng = random.Random(seed)
+    results = []
+    for i in range(count):
+        result = {"user_input": f"анализ {i}"}
+        for lab in LABS:
+            price = float(rng.randint(150, 9000)) if rng.random() > 0.15 else None
+            result[lab] = {"name": None, "price": price, "link": None}
+        results.append(result)
+    return results
+
+def _brute_force_basket(results, fee):
+    # Перебор всех назначений анализов лабораториям: 3^n вариантов
+    best = float("inf")
+    options = [[lab for lab in LABS if r[lab]["price"] is not None] for r in results]
+    for choice in itertools.product(*[o for o in options if o]):
+        total = sum(r[lab]["price"] for r, lab in zip([r for r, o in zip(results, options) if o], choice))
+        best = min(best, total + fee * len(set(choice)))
+    return best
+
+def bench_basket(repeat=1000):
+    from basket import optimize_basket
+
+    fee = 250
+    same = 0
+    for seed in range(50):
+        results = _basket_results(8, seed)
+        same += abs(optimize_basket(results, fee)["split"]["total"] - _brute_force_basket(results, fee)) < 1e-6
+    print(f"Оптимум совпадает с полным перебором: {same}/50 (по 8 анализов)")
+
+    small = _basket_results(8, 0)
+    report("Корзина из 8 анализов, перебор и оптимизатор",
+           measure(lambda: _brute_force_basket(small, fee), 3), measure(lambda: optimize_basket(small, fee), repeat))
+    results = _basket_results(20, 0)
+    print(f"Корзина из 20 анализов: {measure(lambda: optimize_basket(results, fee), repeat) * 1000:.3f} мс")
+
+def _load_all(name, paths):
+    # Выполняется в отдельном процессе, чтобы RSS не смешивался между форматами
+    import resource
+    from storage import read_catalog
+
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    frames = [read_catalog(path, name) for path in paths]
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed, (peak - base) / 1024, len(frames)
+
+def bench_storage(city_filename="бенчмарк"):
+    from cities import cities
+    from storage import EXTENSIONS, write_catalog_copy
+
+    # Все пары лаборатория × город: копии одного синтетического каталога
+    with tempfile.TemporaryDirectory() as storage_dir:
+        paths = []
+        for lab in LABS:
+            source = catalog_path(lab, city_filename)
+            for n in range(len(cities)):
+                path = os.path.join(storage_dir, f"{lab}_{n}.csv")
+                shutil.copyfile(source, path)
+                for name in EXTENSIONS:
+                    write_catalog_copy(path, name)
+                paths.append(path)
+
+        context = multiprocessing.get_context("spawn")
+        for name in ["csv", *EXTENSIONS]:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                elapsed, rss, count = pool.submit(_load_all, name, paths).result()
+            print(f"Хранение {name}: {count} файлов за {elapsed:.2f} с "
+                  f"({elapsed / count * 1000:.2f} мс на файл), прирост RSS {rss:.0f} МБ")
+
+def invitro_page(count=2000, seed=3):
+    # Похоже на реальную страницу: много служебной разметки вокруг карточек
+    rng = random.Random(seed)
+    noise = "".join(f'<li class="menu__item"><a href="/m/{i}">Раздел&nbsp;{i}</a></li>' for i in range(300))
+    items = []
+    for i in range(count):
+        title = " ".join(rng.sample(WORDS, 4)).capitalize()
+        items.append(
+            f'<div class="analyzes-item" data-id="{i}"><div class="analyzes-item__head">'
+            f'<div class="analyzes-item__title"><a href="/analizes/for-doctors/{i}/">{title} &amp; №{i}</a></div>'
+            f'<div class="analyzes-item__description">\n  {title.lower()} — описание  </div></div>'
+            f'<div class="analyzes-item__total"><span class="analyzes-item__total--sum">'
+            f'{rng.randint(100, 9000)}&nbsp;₽</span></div><script>var x = {i};</script></div>'
+        )
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Анализы</title></head><body>'
+            f'<nav><ul>{noise}</ul></nav><main>{"".join(items)}</main><footer>{noise}</footer></body></html>'
+            ).encode("utf-8")
+
+def gemotest_page(count=2000, seed=4):
+    rng = random.Random(seed)
+    noise = "".join(f'<div class="banner"><p>Акция {i}</p></div>' for i in range(300))
+    items = "".join(
+        f'<div class="analysis-item" data-eec-name=" {" ".join(rng.sample(WORDS, 3))} {i} " '
+        f'data-eec-price="{rng.randint(100, 9000)}"><a class="analysis-item__title" href="/moskva/catalog/{i}/">'
+        f'<span>Название</span></a><div class="analysis-item__price">цена</div></div>'
+        for i in range(count)
+    )
+    return f'<html><body>{noise}<section>{items}</section>{noise}</body></html>'.encode("utf-8")
+
+def _select_invitro(content):
+    # Прежнее извлечение: полное дерево html.parser и CSS select
+    from bs4 import BeautifulSoup
+    from parsers.invitro_parser import BASE_URL
+
+    results = []
+    for item in BeautifulSoup(content, 'html.parser').select('.analyzes-item'):
+        title_elem = item.select_one('.analyzes-item__title a')
+        desc_elem = item.select_one('.analyzes-item__description')
+        price_elem = item.select_one('.analyzes-item__total--sum')
+        title = title_elem.text.strip() if title_elem else ''
+        link = BASE_URL + title_elem['href'] if title_elem and title_elem.has_attr('href') else ''
+        description = desc_elem.text.strip() if desc_elem else ''
+        price = price_elem.text.strip() if price_elem else ''
+        if title:
+            results.append({'title': title, 'link': link, 'description': description, 'price': price})
+    return results
+
+def _select_gemotest(content):
+    from bs4 import BeautifulSoup
+    from parsers.gemotest_parser import BASE_URL
+
+    results = []
+    for item in BeautifulSoup(content, 'html.parser').select('.analysis-item'):
+        title = item.get('data-eec-name', '').strip()
+        link_part = item.select_one('a.analysis-item__title')
+        link = BASE_URL + link_part['href'] if link_part and link_part.has_attr('href') else ''
+        price = item.get('data-eec-price', '').strip() + ' ₽' if item.get('data-eec-price') else ''
+        if title:
+            results.append({'title': title, 'link': link, 'description': '', 'price': price})
+    return results
+
+def save_pages(city_name="Москва"):
+    """Сохраняет настоящие страницы каталогов города для замера html_extract"""
+    from cities import cities
+    from parsers.gemotest_parser import BASE_URL as GEMOTEST_BASE
+    from parsers.http_client import http_get
+    from parsers.invitro_parser import BASE_URL as INVITRO_BASE
+    from parsers.invitro_parser import HEADERS
+
+    city = cities[city_name]
+    urls = {
+        "invitro": f"{INVITRO_BASE}/analizes/for-doctors/{city['invitro']}/",
+        "gemotest": f"{GEMOTEST_BASE}/{city['gemotest']}/catalog/",
+    }
+    os.makedirs(PAGES_DIR, exist_ok=True)
+    for lab, url in urls.items():
+        response = http_get(url, headers=HEADERS)
+        response.raise_for_status()
+        path = os.path.join(PAGES_DIR, f"{lab}_{city[lab]}.html")
+        with open(path, "wb") as f:
+            f.write(response.content)
+        print(f"{url} -> {path}, {len(response.content)} байт")
+
+def saved_pages(lab):
+    # Страницы, сохранённые save_pages, в байтах — как response.content у парсера
+    for path in sorted(glob.glob(os.path.join(PAGES_DIR, f"{lab}_*.html"))):
+        with open(path, "rb") as f:
+            yield os.path.basename(path), f.read()
+
+def bench_html_extract(repeat=3):
+    from parsers import gemotest_parser, invitro_parser
+    from parsers.extract import BACKENDS
+
+    labs = [
+        ("invitro", _select_invitro, invitro_parser.extract_invitro, invitro_page()),
+        ("gemotest", _select_gemotest, gemotest_parser.extract_gemotest, gemotest_page()),
+    ]
+    cases = []
+    for lab, select, extract, page in labs:
+        cases.append((f"{lab}, синтетическая", select, extract, page))
+        pages = list(saved_pages(lab))
+        if not pages:
+            print(f"Сохранённых страниц {lab} нет в {PAGES_DIR}: python benchmark.py save_pages")
+        cases += [(name, select, extract, content) for name, content in pages]
+
+    for name, select, extract, page in cases:
+        reference = select(page)
+        before = measure(lambda: select(page), repeat)
+        for backend in BACKENDS:
+            rows = list(extract(page, backend))
+            same = "совпадают" if rows == reference else "ОТЛИЧАЮТСЯ"
+            after = measure(lambda: list(extract(page, backend)), repeat)
+            report(f"Разбор {name}, {len(rows)} карточек, {backend} (строки {same})", before, after)
+
+def _stream_rows(count, seed):
+    # Каталог один и тот же, от seed зависят только цены: в каждом
+    # обновлении меняется примерно каждая двадцатая
+    rng, prices = random.Random(0), random.Random(seed)
+    for i in range(count):
+        title = " ".join(rng.sample(WORDS, 5)).capitalize()
+        price = rng.randint(150, 9000)
+        if prices.random() < 0.05:
+            price += prices.randint(1, 100)
+        yield {
+            "title": f"{title} №{i}",
+            "link": f"https://example.test/invitro/{i}",
+            "description": " ".join(rng.sample(WORDS, 12)),
+            "price": f"{price} ₽",
+        }
+
+def _proc_status(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+
+def _merge_rss(path, count, seed, materialize):
+    # Выполняется в отдельном процессе: прирост пикового RSS на одно слияние.
+    # Пик после импортов сбрасывается через clear_refs (Linux)
+    rows = list(_stream_rows(count, seed)) if materialize else _stream_rows(count, seed)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    base = _proc_status("VmRSS")
+    merge = update_or_add_products(rows, path)
+    return (_proc_status("VmHWM") - base) / 1024, len(merge.updated)
+
+def bench_stream_merge(sizes=(10000, 40000)):
+    # Пиковая память на обновление уже существующего каталога того же размера.
+    # Для списка целиком сами строки создаются до замера, в счёт идёт только слияние
+    context = multiprocessing.get_context("spawn")
+    for count in sizes:
+        path = os.path.join(config.DATA_DIR, f"invitro_поток{count}.csv")
+        update_or_add_products(_stream_rows(count, 1), path)
+        measured = []
+        for seed, materialize in ((2, True), (3, False)):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                measured.append(pool.submit(_merge_rss, path, count, seed, materialize).result())
+        (before, _), (after, updated) = measured
+        print(f"Слияние {count} строк ({updated} изменено): прирост RSS "
+              f"со списком целиком {before:.1f} МБ, потоком {after:.1f} МБ")
+
+BENCHMARKS = {
+    "catalog_cache": bench_catalog_cache,
+    "title_index": bench_title_index,
+    "batch_compare": bench_batch_compare,
+    "result_cache": bench_result_cache,
+    "storage": bench_storage,
+    "html_extract": bench_html_extract,
+    "stream_merge": bench_stream_merge,
+    "basket": bench_basket,
+}
+
+def main(names):
+    if names[:1] == ["save_pages"]:
+        save_pages(*names[1:])
+        return
+    with tempfile.TemporaryDirectory() as data_dir:
+        config.DATA_DIR = data_dir
+        make_catalogs(data_dir, "бенчмарк")
+        for name in names or BENCHMARKS:
+            BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
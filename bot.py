@@ -1,20 +1,26 @@
+import asyncio
 import logging
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes
 from cities import cities
-from comparator import compare_analyses
-from parsers.invitro_parser import parse_invitro_for_city
-from parsers.gemotest_parser import parse_all_gemotest
-from parsers.helix import parse_helix, load_helix_cities
-import os
+from comparator import compare_analyses, result_cache
+from basket import optimize_basket
+from catalog import LABS, catalog_cache, normalize_city_filename
+from crawler import PARSERS, QUICK_PARSERS, is_supported, scrape
+from freshness import freshness_tracker
+from parsers.helix import load_helix_cities
+from refresh import RefreshCoordinator, RefreshScheduler
+from sessions import AsyncSessionStore, add_analyses, get_session_store
+from update_processor import PerUserUpdateProcessor
+import config
 import datetime
 
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
 
-user_states = {}
-
-def normalize_city_filename(city_name: str) -> str:
-    return city_name.lower().replace(" ", "-").replace("ё", "е")
+# Обращения к хранилищу диалогов (SQLite может ждать блокировку) идут в пуле потоков
+session_store = AsyncSessionStore(get_session_store())
+refresh_coordinator = RefreshCoordinator()
+background_tasks = set()
 
 def format_results(results):
     messages = []
@@ -40,12 +46,33 @@ def format_results(results):
         messages.append("\n".join(lines))
     return "\n\n".join(messages)
 
-def is_file_fresh(path, max_age_hours=24):
-    if not os.path.exists(path):
-        return False
-    mod_time = datetime.datetime.fromtimestamp(os.path.getmtime(path))
-    age = datetime.datetime.now() - mod_time
-    return age.total_seconds() < max_age_hours * 3600
+def format_basket(results):
+    # Итог по всему списку из уже посчитанных результатов
+    basket = optimize_basket(results)
+    lines = [f"🧺 В списке {len(results)} анализов"]
+    if basket["missing"]:
+        lines.append(f"Нет цен: {', '.join(basket['missing'])}")
+    single, split = basket["single"], basket["split"]
+    if split is None:
+        return "\n".join(lines)
+
+    if single:
+        lines.append(f"🏥 Всё в одной лаборатории: {single['lab'].capitalize()} — *{single['total']:.0f} ₽*")
+        others = [f"{lab.capitalize()} — {total:.0f} ₽" for lab, total in basket["labs"].items()
+                  if total is not None and lab != single["lab"]]
+        if others:
+            lines.append(f"Другие лаборатории: {', '.join(others)}")
+    else:
+        lines.append("🏥 Ни одна лаборатория не делает все анализы из списка")
+    if len(split["visits"]) > 1:
+        saving = f" (экономия {single['total'] - split['total']:.0f} ₽)" if single else ""
+        lines.append(f"🔀 Дешевле разделить: *{split['total']:.0f} ₽*{saving}")
+        for lab, names in split["visits"].items():
+            lines.append(f"• {lab.capitalize()}: {', '.join(names)}")
+    fees = sorted(set(basket["fees"].values()))
+    if any(fees):
+        lines.append(f"В суммах учтён забор материала: {' / '.join(f'{fee:.0f}' for fee in fees)} ₽ за визит")
+    return "\n".join(lines)
 
 def find_city_in_cities(user_input):
     normalized_input = user_input.lower().replace(" ", "").replace("-", "")
@@ -55,6 +82,75 @@ def find_city_in_cities(user_input):
             return city_key
     return None
 
+def lab_statuses(city_key):
+    """Свежесть данных каждой лаборатории, которая есть в городе"""
+    return {lab: freshness_tracker.status(lab, city_key) for lab in PARSERS if is_supported(cities[city_key], lab)}
+
+def stale_labs(city_keys):
+    # Для фонового обновления: один запрос по всем популярным городам
+    pairs = [(lab, city_key) for city_key in city_keys for lab in PARSERS if is_supported(cities[city_key], lab)]
+    stale = {}
+    for lab, city_key in freshness_tracker.stale_pairs(pairs, config.REFRESH_AHEAD_HOURS):
+        stale.setdefault(city_key, []).append(lab)
+    return stale
+
+async def refresh_city_data(city_key, helix_cities, labs, quick=False):
+    # Парсеры блокирующие, поэтому запускаем их в пуле потоков,
+    # чтобы не останавливать цикл событий для остальных чатов.
+    # Все лаборатории обновляются одновременно, а одновременные запросы
+    # одного города ждут один общий парсинг.
+    city_filename = normalize_city_filename(city_key)
+    tasks = {lab: refresh_coordinator.run(lab, city_key, scrape, lab, city_key, helix_cities, quick) for lab in labs}
+
+    if tasks:
+        logging.info(f"Обновление {len(tasks)} лабораторий для города {city_key}")
+        merges = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for lab, merge in zip(tasks, merges):
+            # Каталог сбрасываем, только если файл действительно переписан
+            if isinstance(merge, BaseException) or (merge and merge.written):
+                catalog_cache.invalidate(lab, city_filename)
+                result_cache.invalidate(lab, city_filename)
+        errors = [merge for merge in merges if isinstance(merge, BaseException)]
+        if errors:
+            raise errors[0]
+
+def session_results(state, city_filename, helix_cities):
+    """Результаты всех анализов диалога; сравниваются только те, которых ещё нет.
+
+    Если с прошлого раза каталог какой-то лаборатории обновился,
+    сохранённые результаты устарели и считаются заново.
+    """
+    versions = {lab: str(catalog_cache.get(lab, city_filename).version) for lab in LABS}
+    if state.get("versions") != versions:
+        state["versions"] = versions
+        state["results"] = {}
+    results = state.setdefault("results", {})
+
+    pending = [name for name in state["analyses"] if name.lower() not in results]
+    if pending:
+        for result in compare_analyses(pending, city_filename, helix_cities):
+            results[result["user_input"].lower()] = result
+    return results
+
+def revalidate_in_background(city_key, helix_cities, labs):
+    # Устаревшие данные уже отданы пользователю, обновление идёт без ожидания
+    task = asyncio.create_task(refresh_city_data(city_key, helix_cities, labs))
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+
+def _background_done(task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logging.error(f"Фоновое обновление не удалось: {task.exception()}")
+
+def staleness_note(statuses, stale):
+    updated = min(datetime.datetime.now() - datetime.timedelta(hours=statuses[lab].age) for lab in stale)
+    names = ", ".join(lab.capitalize() for lab in stale)
+    if all(statuses[lab].retry_in for lab in stale):
+        return f"⏳ Цены {names} от {updated:%d.%m %H:%M}: сайт сейчас недоступен, обновим позже."
+    return (f"⏳ Цены {names} от {updated:%d.%m %H:%M}, сейчас обновляются. "
+            "Повторите запрос через пару минут, чтобы увидеть свежие.")
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logging.info(f"/start от пользователя {update.effective_user.id}")
     faq_text = (
@@ -67,22 +163,23 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Если хочешь завершить диалог — напиши /stop"
     )
     await update.message.reply_text(faq_text)
-    user_states[update.effective_user.id] = {"step": "await_city", "analyses": []}
+    await session_store.set(update.effective_user.id, {"step": "await_city", "analyses": []})
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     text = update.message.text.strip()
     logging.info(f"Получено сообщение от {user_id}: {text}")
 
-    if user_id not in user_states:
+    # Хранилище может быть общим для нескольких воркеров,
+    # поэтому состояние читается заново и сохраняется после каждого изменения
+    state = await session_store.get(user_id)
+    if state is None:
         await update.message.reply_text("Напиши /start чтобы начать.")
         return
 
-    state = user_states[user_id]
-
     if text.lower() == "/stop":
         await update.message.reply_text("Диалог завершён. Спасибо!")
-        user_states.pop(user_id)
+        await session_store.delete(user_id)
         return
 
     if state["step"] == "await_city":
@@ -93,6 +190,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         state["city"] = city_name
         state["step"] = "await_analyses"
+        await session_store.set(user_id, state)
         await update.message.reply_text(
             f"Город выбран: {city_name}\n"
             "Теперь введи через запятую точные названия анализов для сравнения.\n"
@@ -101,54 +199,63 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     elif state["step"] == "await_analyses":
-        new_analyses = [x.strip() for x in text.split(",") if x.strip()]
-        state["analyses"].extend(new_analyses)
+        new_analyses = list({x.strip().lower(): x.strip() for x in text.split(",") if x.strip()}.values())
+        if not new_analyses:
+            await update.message.reply_text("Введите названия анализов через запятую.")
+            return
+        add_analyses(state, new_analyses)
+        await session_store.set(user_id, state)
 
         city_key = state["city"]
-        city_info = cities[city_key]
-
-        invitro_slug = city_info.get("invitro")
-        gemotest_slug = city_info.get("gemotest")
-        helix_id = city_info.get("helix")
-
         city_filename = normalize_city_filename(city_key)
 
-        invitro_path = os.path.join("data", f"invitro_{city_filename}.csv")
-        gemotest_path = os.path.join("data", f"gemotest_{city_filename}.csv")
-        helix_path = os.path.join("data", f"helix_{city_filename}.csv")
-
-        await update.message.reply_text("Обновляю данные, если нужно...")
-
-        try:
-            if invitro_slug and invitro_slug != "-":
-                if not is_file_fresh(invitro_path):
-                    parse_invitro_for_city(city_key)
-
-            if gemotest_slug and gemotest_slug != "-":
-                if not is_file_fresh(gemotest_path):
-                    parse_all_gemotest(city_key)
-
-            if helix_id and helix_id != "-":
-                if not is_file_fresh(helix_path):
-                    helix_cities = context.bot_data.get("helix_cities", [])
-                    parse_helix(city_key, helix_cities)
-
-        except Exception as e:
-            await update.message.reply_text(f"Ошибка при обновлении данных: {e}")
-            user_states.pop(user_id)
-            return
-
-        await update.message.reply_text("Данные обновлены, ищу результаты...")
-
+        helix_cities = context.bot_data.get("helix_cities", [])
+        scheduler = context.bot_data.get("refresh_scheduler")
+        if scheduler:
+            scheduler.record_query(city_key)
+
+        # Устаревшие данные отдаём сразу и обновляем в фоне,
+        # ждать приходится только лаборатории, данных которых ещё нет.
+        # Сайт, который недавно не ответил, до конца паузы не трогаем
+        statuses = lab_statuses(city_key)
+        missing = [lab for lab, status in statuses.items() if status.age is None and not status.retry_in]
+        stale = [lab for lab, status in statuses.items() if status.age is not None and not status.fresh]
+        revalidate = [lab for lab in stale if not statuses[lab].retry_in]
+
+        if missing:
+            await update.message.reply_text("Загружаю данные лабораторий, это займёт немного времени...")
+            try:
+                # Пока пользователь ждёт, качаем только первые страницы больших каталогов
+                await refresh_city_data(city_key, helix_cities, missing, quick=True)
+            except Exception as e:
+                await update.message.reply_text(f"Ошибка при обновлении данных: {e}")
+                await session_store.delete(user_id)
+                return
+            await update.message.reply_text("Данные обновлены, ищу результаты...")
+            # а полный каталог дособираем в фоне; до тех пор цены помечены как неполные
+            partial = [lab for lab in missing if lab in QUICK_PARSERS]
+            statuses.update({lab: freshness_tracker.status(lab, city_key) for lab in partial})
+            stale += partial
+            revalidate += partial
+        if revalidate:
+            revalidate_in_background(city_key, helix_cities, revalidate)
+
+        # Сравниваются только новые анализы, результаты прежних хранятся в диалоге
         try:
-            helix_cities = context.bot_data.get("helix_cities", [])
-            results = compare_analyses(state["analyses"], city_filename, helix_cities)
+            results = await asyncio.to_thread(session_results, state, city_filename, helix_cities)
         except FileNotFoundError as e:
             await update.message.reply_text(str(e))
-            user_states.pop(user_id)
+            await session_store.delete(user_id)
             return
-
-        msg = format_results(results)
+        await session_store.set(user_id, state)
+        logging.info(f"Кэш результатов: {result_cache.stats()}")
+
+        # В ответе только анализы из этого сообщения, а итог — по всему списку
+        msg = format_results([results[name.lower()] for name in new_analyses[-len(state["analyses"]):]])
+        if len(state["analyses"]) > 1:
+            msg += "\n\n" + format_basket([results[name.lower()] for name in state["analyses"]])
+        if stale:
+            msg += "\n\n" + staleness_note(statuses, stale)
         await update.message.reply_text(msg, parse_mode="Markdown", disable_web_page_preview=True)
 
         await update.message.reply_text(
@@ -156,9 +263,33 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Или напишите /stop для завершения."
         )
 
+async def post_init(app):
+    # Фоновое обновление работает в том же цикле событий, что и бот
+    helix_cities = app.bot_data["helix_cities"]
+    scheduler = RefreshScheduler(
+        lambda city_key, labs: refresh_city_data(city_key, helix_cities, labs), stale_labs
+    )
+    app.bot_data["refresh_scheduler"] = scheduler
+    app.bot_data["refresh_task"] = asyncio.create_task(scheduler.run())
+
+async def post_shutdown(app):
+    task = app.bot_data.get("refresh_task")
+    if task:
+        task.cancel()
+    refresh_coordinator.shutdown()
+
 def main():
+    # Без публичного адреса PTB зарегистрировал бы в Telegram адрес вида
+    # https://0.0.0.0:8443/..., и апдейты молча перестали бы приходить
+    if config.BOT_MODE == "webhook" and not config.WEBHOOK_URL:
+        raise ValueError("Для BOT_MODE=webhook нужен WEBHOOK_URL — публичный адрес бота")
+
     logging.info("Запуск бота")
-    app = ApplicationBuilder().token("").build()
+    # Апдейты разных чатов обрабатываются параллельно, одного чата — по порядку,
+    # поэтому долгое сравнение в одном чате не задерживает остальные
+    app = (ApplicationBuilder().token(config.BOT_TOKEN).base_url(config.TELEGRAM_API_URL)
+           .concurrent_updates(PerUserUpdateProcessor(config.BOT_CONCURRENCY))
+           .post_init(post_init).post_shutdown(post_shutdown).build())
 
     # Загружаем helix_cities один раз и сохраняем в bot_data
     app.bot_data["helix_cities"] = load_helix_cities("helix_cities.json")
@@ -166,8 +297,18 @@ def main():
     app.add_handler(CommandHandler("start", start))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
-    logging.info("Бот запущен и ожидает сообщений")
-    app.run_polling()
+    if config.BOT_MODE == "webhook":
+        logging.info(f"Бот принимает апдейты на {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT}/{config.WEBHOOK_PATH}")
+        app.run_webhook(
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            webhook_url=f"{config.WEBHOOK_URL.rstrip('/')}/{config.WEBHOOK_PATH}",
+            secret_token=config.WEBHOOK_SECRET or None,
+        )
+    else:
+        logging.info("Бот запущен и ожидает сообщений")
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,116 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from functools import cached_property
+import pandas as pd
+import config
+from matcher import TitleIndex
+from storage import catalog_version, read_catalog
+
+LABS = ("invitro", "gemotest", "helix")
+
+def normalize_city_filename(city_name):
+    return city_name.lower().replace(" ", "-").replace("ё", "е")
+
+def catalog_path(lab, city_filename):
+    return os.path.join(config.DATA_DIR, f"{lab}_{city_filename}.csv")
+
+def parse_prices(prices):
+    # Векторный аналог utils.normalize_price для файлов без колонки price_value
+    digits = prices.astype(str).str.replace(r"[^\d,\.]", "", regex=True).str.replace(',', '.').str.strip('.')
+    return pd.to_numeric(digits, errors='coerce')
+
+def load_catalog(path):
+    df = read_catalog(path)
+    df['title_lower'] = df['title'].str.lower()
+    if 'price_value' not in df.columns:
+        df['price_value'] = parse_prices(df['price'])
+    return df
+
+class Catalog:
+    """Каталог одной лаборатории в городе и поисковый индекс по его названиям"""
+
+    def __init__(self, df, version=None):
+        self.df = df
+        # Версия файла, из которого прочитан каталог (см. storage.catalog_version)
+        self.version = version
+
+    @cached_property
+    def index(self):
+        return TitleIndex(self.df["title_lower"].tolist())
+
+    @cached_property
+    def row_by_title(self):
+        # Номер первой строки для каждого названия, как df[df.title_lower == t].iloc[0]
+        rows = {}
+        for i, title in enumerate(self.df["title_lower"].tolist()):
+            rows.setdefault(title, i)
+        return rows
+
+    def row(self, title_lower):
+        return self.df.iloc[self.row_by_title[title_lower]]
+
+    def memory_usage(self):
+        """Объём таблицы вместе с индексами; индексы при этом строятся сразу"""
+        size = int(self.df.memory_usage(deep=True).sum()) + self.index.memory_usage()
+        size += sys.getsizeof(self.row_by_title)
+        size += sum(sys.getsizeof(title) + 28 for title in self.row_by_title)
+        return size
+
+class CatalogCache:
+    """Кэш разобранных каталогов (Catalog) по ключу (лаборатория, город).
+
+    Запись считается устаревшей, если сменилась версия каталога: mtime и размер
+    файла или номер обновления в базе SQLite.
+    Суммарный объём ограничен max_bytes, вытесняются давно не использованные.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, lab, city_filename):
+        key = (lab, city_filename)
+        path = catalog_path(lab, city_filename)
+        try:
+            version = catalog_version(path)
+        except FileNotFoundError:
+            self.invalidate(lab, city_filename)
+            raise FileNotFoundError(f"Файл не найден: {path}")
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        catalog = Catalog(load_catalog(path), version)
+        # Индексы строятся сразу при загрузке, чтобы их объём учитывался в лимите
+        size = catalog.memory_usage()
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self.total_bytes -= old[2]
+            self._entries[key] = (version, catalog, size)
+            self.total_bytes += size
+            # Самый свежий каталог не вытесняем, даже если он один больше лимита
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+        return catalog
+
+    def invalidate(self, lab=None, city_filename=None):
+        with self._lock:
+            for key in list(self._entries):
+                if (lab is None or key[0] == lab) and (city_filename is None or key[1] == city_filename):
+                    self.total_bytes -= self._entries.pop(key)[2]
+
+catalog_cache = CatalogCache(config.CATALOG_CACHE_MAX_MB * 1024 * 1024)
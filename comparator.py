@@ -1,54 +1,98 @@
-import pandas as pd
-from fuzzywuzzy import process
+from fuzzywuzzy import fuzz, process
+import functools
+import importlib
 import os
-import re
-from synonym import SYNONYMS
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import config
+import synonym
 from cities import cities  # словарь городов с id Helix
+from catalog import LABS, catalog_cache
+from matcher import process_query, process_title
 
-DATA_DIR = os.path.join("data")
-
-def clean_price(price_str):
-    if pd.isna(price_str):
-        return None
-    if isinstance(price_str, bytes):
-        price_str = price_str.decode('utf-8')
-    else:
-        price_str = str(price_str)
-    price_num = re.sub(r"[^\d,\.]", "", price_str)
-    price_num = price_num.replace(',', '.')
-    try:
-        return float(price_num)
-    except:
-        return None
+LAB_NAMES = {"invitro": "Инвитро", "gemotest": "Гемотест", "helix": "Хеликс"}
 
 def format_price(price):
     if price is None:
         return "—"
     return f"{price:,.0f} ₽".replace(",", " ")
 
-def normalize_input(user_input, threshold=85):
-    user_input = user_input.strip().lower()
-    
-    # Точный поиск по синонимам
-    for canonical, variants in SYNONYMS.items():
-        if user_input == canonical.lower() or user_input in map(str.lower, variants):
+class SynonymResolver:
+    """Поиск канонического названия анализа по словарю SYNONYMS.
+
+    Таблицы строятся один раз и пересобираются, только если изменился synonym.py.
+    """
+
+    def __init__(self, module):
+        self._module = module
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._build()
+
+    def _source_mtime(self):
+        try:
+            return os.path.getmtime(self._module.__file__)
+        except OSError:
+            return self._mtime
+
+    def _build(self):
+        self._mtime = self._source_mtime()
+        exact = {}
+        terms = []
+        mapping = {}
+        for canonical, variants in self._module.SYNONYMS.items():
+            # Порядок важен: при совпадении у нескольких записей побеждает первая
+            exact.setdefault(canonical.lower(), canonical)
+            for variant in variants:
+                exact.setdefault(variant.lower(), canonical)
+            terms.append(canonical)
+            mapping[canonical] = canonical
+            for variant in variants:
+                terms.append(variant)
+                mapping[variant] = canonical
+        self._exact = exact
+        # Уже разобранные вводы пользователей сбрасываются вместе со словарём
+        self._resolve.cache_clear()
+        # Термины заранее обработаны так же, как это делает extractOne
+        self._terms = [(process_title(t), mapping[t]) for t in terms]
+
+    def reload_if_changed(self):
+        if self._source_mtime() == self._mtime:
+            return
+        with self._lock:
+            if self._source_mtime() != self._mtime:
+                importlib.reload(self._module)
+                self._build()
+
+    def resolve(self, user_input, threshold=85):
+        self.reload_if_changed()
+        return self._resolve(user_input.strip().lower(), threshold)
+
+    @functools.lru_cache(maxsize=config.SYNONYM_CACHE_SIZE)
+    def _resolve(self, user_input, threshold):
+        # Точный поиск по синонимам
+        canonical = self._exact.get(user_input)
+        if canonical is not None:
             return canonical
-    
-    # Fuzzy поиск по всем вариантам
-    all_terms = []
-    mapping = {}
-    for canonical, variants in SYNONYMS.items():
-        all_terms.append(canonical)
-        mapping[canonical] = canonical
-        for variant in variants:
-            all_terms.append(variant)
-            mapping[variant] = canonical
-
-    match, score = process.extractOne(user_input, all_terms)
-    if match and score >= threshold:
-        return mapping[match]
-    
-    return user_input
+
+        # Fuzzy поиск по всем вариантам
+        processed = process_query(user_input)
+        best, best_score = None, -1
+        for term, canonical in self._terms:
+            score = fuzz.WRatio(processed, term, full_process=False)
+            if score > best_score:
+                best, best_score = canonical, score
+        if best and best_score >= threshold:
+            return best
+
+        return user_input
+
+synonym_resolver = SynonymResolver(synonym)
+
+def normalize_input(user_input, threshold=85):
+    return synonym_resolver.resolve(user_input, threshold)
 
 def find_best_match(name, choices, threshold=60):
     match, score = process.extractOne(name, choices)
@@ -90,86 +134,133 @@ def fix_helix_link(link, city_rus_slug, helix_cities):
     else:
         return link
 
-def compare_analyses(analysis_names, city_rus_slug, helix_cities):
-    invitro_path = os.path.join(DATA_DIR, f"invitro_{city_rus_slug}.csv")
-    gemotest_path = os.path.join(DATA_DIR, f"gemotest_{city_rus_slug}.csv")
-    helix_path = os.path.join(DATA_DIR, f"helix_{city_rus_slug}.csv")
+def match_catalog(catalog, queries):
+    # Все запросы сопоставляются с каталогом за один проход по индексу
+    matches = catalog.index.extract_many(queries)
+    return {q: catalog.row(title) if title else None for q, title in zip(queries, matches)}
 
-    for path in [invitro_path, gemotest_path, helix_path]:
-        if not os.path.isfile(path):
-            raise FileNotFoundError(f"Файл не найден: {path}")
+NOT_FOUND = {"name": None, "price": None, "link": None}
 
-    invitro_df = pd.read_csv(invitro_path, encoding='utf-8-sig')
-    gemotest_df = pd.read_csv(gemotest_path, encoding='utf-8-sig')
-    helix_df = pd.read_csv(helix_path, encoding='utf-8-sig')
+class ResultCache:
+    """Кэш найденных позиций по ключу (город, лаборатория, нормализованный анализ).
 
-    invitro_df['title_lower'] = invitro_df['title'].str.lower()
-    gemotest_df['title_lower'] = gemotest_df['title'].str.lower()
-    helix_df['title_lower'] = helix_df['title'].str.lower()
+    Запись привязана к версии каталога, из которого найдена: после обновления
+    файла она не используется. Кроме того, записи живут не дольше ttl секунд,
+    а при переполнении вытесняются давно не использованные.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, city_filename, lab, version, queries):
+        """Найденные записи {запрос: позиция} и список запросов, которых в кэше нет"""
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for query in queries:
+                key = (city_filename, lab, query)
+                entry = self._entries.get(key)
+                if entry and entry[0] == version and now - entry[1] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    found[query] = entry[2]
+                    self.hits += 1
+                    continue
+                if entry:
+                    del self._entries[key]
+                missing.append(query)
+                self.misses += 1
+        return found, missing
+
+    def put_many(self, city_filename, lab, version, matches):
+        now = time.monotonic()
+        with self._lock:
+            for query, match in matches.items():
+                key = (city_filename, lab, query)
+                self._entries.pop(key, None)
+                self._entries[key] = (version, now, match)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, lab=None, city_filename=None):
+        with self._lock:
+            for key in list(self._entries):
+                if (city_filename is None or key[0] == city_filename) and (lab is None or key[1] == lab):
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+            }
+
+result_cache = ResultCache(config.RESULT_CACHE_SIZE, config.RESULT_CACHE_TTL_MIN * 60)
+
+def match_lab(catalog, lab, city_rus_slug, queries):
+    # Позиции лаборатории для запросов: из кэша результатов, остальные — поиском по каталогу
+    found, missing = result_cache.get_many(city_rus_slug, lab, catalog.version, queries)
+    if missing:
+        matches = {}
+        for query, row in match_catalog(catalog, missing).items():
+            if row is None:
+                matches[query] = NOT_FOUND
+                continue
+            # Цена уже разобрана в число при парсинге, NaN — цену распознать не удалось
+            price = float(row["price_value"])
+            matches[query] = {"name": row["title"], "price": None if np.isnan(price) else price, "link": row["link"]}
+        result_cache.put_many(city_rus_slug, lab, catalog.version, matches)
+        found.update(matches)
+    return found
+
+def compare_analyses(analysis_names, city_rus_slug, helix_cities):
+    # Каталоги берутся из кэша процесса и перечитываются только после обновления файла
+    catalogs = {lab: catalog_cache.get(lab, city_rus_slug) for lab in LABS}
+
+    normalized = [normalize_input(user_input) for user_input in analysis_names]
+    queries = list(dict.fromkeys(normalized))
+    matches = {lab: match_lab(catalogs[lab], lab, city_rus_slug, queries) for lab in LABS}
 
     results = []
+    prices = np.full((len(analysis_names), len(LABS)), np.nan)
 
-    for user_input in analysis_names:
-        normalized_input = normalize_input(user_input)
+    for i, (user_input, normalized_input) in enumerate(zip(analysis_names, normalized)):
+        result = {"user_input": user_input.strip()}
 
-        invitro_match = find_best_match(normalized_input, invitro_df["title_lower"].tolist())
-        gemotest_match = find_best_match(normalized_input, gemotest_df["title_lower"].tolist())
-        helix_match = find_best_match(normalized_input, helix_df["title_lower"].tolist())
+        for j, lab in enumerate(LABS):
+            # Копия, чтобы изменения результата не попали в кэш
+            result[lab] = match = dict(matches[lab][normalized_input])
+            if match["name"] is None:
+                continue
 
-        if invitro_match:
-            i_row = invitro_df[invitro_df["title_lower"] == invitro_match].iloc[0]
-            i_price = clean_price(i_row["price"])
-            i_link = i_row["link"]
-            i_name = i_row["title"]
-        else:
-            i_price = None
-            i_link = None
-            i_name = None
-
-        if gemotest_match:
-            g_row = gemotest_df[gemotest_df["title_lower"] == gemotest_match].iloc[0]
-            g_price = clean_price(g_row["price"])
-            g_link = g_row["link"]
-            g_name = g_row["title"]
-        else:
-            g_price = None
-            g_link = None
-            g_name = None
-
-        if helix_match:
-            h_row = helix_df[helix_df["title_lower"] == helix_match].iloc[0]
-            h_price = clean_price(h_row["price"])
-            h_link_raw = h_row["link"]
-            h_name = h_row["title"]
-
-            # Исправляем ссылку Helix с alias города
-            h_link = fix_helix_link(h_link_raw, city_rus_slug, helix_cities)
-        else:
-            h_price = None
-            h_link = None
-            h_name = None
-
-        prices = []
-        if i_price is not None:
-            prices.append(("Инвитро", i_price, i_link))
-        if g_price is not None:
-            prices.append(("Гемотест", g_price, g_link))
-        if h_price is not None:
-            prices.append(("Хеликс", h_price, h_link))
-
-        if prices:
-            cheapest = min(prices, key=lambda x: x[1])
-            cheapest_lab, cheapest_price, cheapest_link = cheapest
-        else:
-            cheapest_lab, cheapest_price, cheapest_link = None, None, None
+            if lab == "helix":
+                # Исправляем ссылку Helix с alias города
+                match["link"] = fix_helix_link(match["link"], city_rus_slug, helix_cities)
+            if match["price"] is not None:
+                prices[i, j] = match["price"]
 
-        results.append({
-            "user_input": user_input.strip(),
-            "invitro": {"name": i_name, "price": i_price, "link": i_link},
-            "gemotest": {"name": g_name, "price": g_price, "link": g_link},
-            "helix": {"name": h_name, "price": h_price, "link": h_link},
-            "cheapest": {"lab": cheapest_lab, "price": cheapest_price, "link": cheapest_link},
-        })
+        results.append(result)
 
-    return results
+    # Самая дешёвая лаборатория сразу для всех анализов; при равных ценах
+    # argmin берёт первую по порядку LABS
+    has_price = ~np.isnan(prices).all(axis=1)
+    cheapest_idx = np.argmin(np.where(np.isnan(prices), np.inf, prices), axis=1)
+
+    for result, found, j in zip(results, has_price, cheapest_idx):
+        if found:
+            lab = LABS[j]
+            result["cheapest"] = {"lab": LAB_NAMES[lab], "price": result[lab]["price"], "link": result[lab]["link"]}
+        else:
+            result["cheapest"] = {"lab": None, "price": None, "link": None}
 
+    return results
@@ -0,0 +1,126 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Telegram: токен бота и адрес Bot API (можно направить на локальную заглушку)
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+
+# Режим работы: polling или webhook. Для webhook нужен
+# pip install "python-telegram-bot[webhooks]"; бот слушает WEBHOOK_LISTEN:WEBHOOK_PORT,
+# а Telegram шлёт апдейты на WEBHOOK_URL/WEBHOOK_PATH с заголовком WEBHOOK_SECRET
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Сколько апдейтов разных пользователей обрабатывается одновременно
+BOT_CONCURRENCY = int(os.getenv("BOT_CONCURRENCY", "64"))
+
+# Папка с CSV-файлами цен
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+# Ограничение памяти под кэш каталогов в процессе
+CATALOG_CACHE_MAX_MB = int(os.getenv("CATALOG_CACHE_MAX_MB", "256"))
+
+# Кэш готовых результатов сравнения (город, лаборатория, анализ):
+# не больше RESULT_CACHE_SIZE записей, каждая живёт RESULT_CACHE_TTL_MIN минут
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "20000"))
+RESULT_CACHE_TTL_MIN = float(os.getenv("RESULT_CACHE_TTL_MIN", "60"))
+# Сколько последних вводов пользователей помнит поиск по словарю синонимов
+SYNONYM_CACHE_SIZE = int(os.getenv("SYNONYM_CACHE_SIZE", "1024"))
+
+# Плата за визит (забор материала) в рублях, её учитывает расчёт стоимости
+# всего списка; отдельно для лаборатории, например HELIX_VISIT_FEE=300
+VISIT_FEE = float(os.getenv("VISIT_FEE", "250"))
+LAB_VISIT_FEE = {
+    lab: float(os.getenv(f"{lab.upper()}_VISIT_FEE", VISIT_FEE))
+    for lab in ("invitro", "gemotest", "helix")
+}
+
+# Откуда читаются каталоги: csv (только CSV), arrow или parquet (копия рядом с CSV,
+# нужен pyarrow), sqlite (общая база цен PRICE_DB)
+CATALOG_BACKEND = os.getenv("CATALOG_BACKEND", "csv")
+
+# Путь к базе SQLite, по умолчанию DATA_DIR/prices.db
+PRICE_DB = os.getenv("PRICE_DB", "")
+
+# Диалоги бота: memory (в процессе) или sqlite (SESSION_DB, по умолчанию
+# DATA_DIR/sessions.db, можно разложить на SESSION_SHARDS файлов).
+# Диалог забывается через SESSION_TTL_HOURS часов тишины, в нём хранится
+# не больше SESSION_MAX_ANALYSES последних анализов
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_DB = os.getenv("SESSION_DB", "")
+SESSION_SHARDS = int(os.getenv("SESSION_SHARDS", "1"))
+SESSION_TTL_HOURS = float(os.getenv("SESSION_TTL_HOURS", "24"))
+SESSION_MAX_ANALYSES = int(os.getenv("SESSION_MAX_ANALYSES", "20"))
+
+# Адреса сайтов лабораторий; в тестах их можно направить на локальный сервер-заглушку
+INVITRO_URL = os.getenv("INVITRO_URL", "https://www.invitro.ru")
+GEMOTEST_URL = os.getenv("GEMOTEST_URL", "https://gemotest.ru")
+HELIX_URL = os.getenv("HELIX_URL", "https://helix.ru")
+
+# Сколько парсингов бот запускает одновременно (отдельный пул потоков,
+# чтобы фоновые обновления не задерживали сравнения)
+SCRAPE_WORKERS = int(os.getenv("SCRAPE_WORKERS", "6"))
+
+# Ночной обход всех городов: общее число потоков и одновременных запросов к одному сайту
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "12"))
+CRAWL_PER_HOST = int(os.getenv("CRAWL_PER_HOST", "4"))
+
+# Данные лаборатории считаются свежими DATA_MAX_AGE_HOURS часов. Бот сам обновляет
+# популярные города в фоне раз в REFRESH_INTERVAL_MIN минут, начиная за
+# REFRESH_AHEAD_HOURS часов до устаревания; популярность уменьшается вдвое
+# за POPULARITY_HALF_LIFE_HOURS часов
+DATA_MAX_AGE_HOURS = float(os.getenv("DATA_MAX_AGE_HOURS", "24"))
+# Срок свежести отдельно для лаборатории, например HELIX_TTL_HOURS=12
+LAB_TTL_HOURS = {
+    lab: float(os.getenv(f"{lab.upper()}_TTL_HOURS", DATA_MAX_AGE_HOURS))
+    for lab in ("invitro", "gemotest", "helix")
+}
+REFRESH_INTERVAL_MIN = float(os.getenv("REFRESH_INTERVAL_MIN", "10"))
+REFRESH_AHEAD_HOURS = float(os.getenv("REFRESH_AHEAD_HOURS", "2"))
+REFRESH_CITIES_PER_TICK = int(os.getenv("REFRESH_CITIES_PER_TICK", "5"))
+POPULARITY_HALF_LIFE_HOURS = float(os.getenv("POPULARITY_HALF_LIFE_HOURS", "24"))
+
+# После неудачного парсинга пара (лаборатория, город) не обновляется
+# FAILURE_BACKOFF_MIN минут; каждая следующая неудача удваивает паузу
+# до FAILURE_BACKOFF_MAX_HOURS часов
+FAILURE_BACKOFF_MIN = float(os.getenv("FAILURE_BACKOFF_MIN", "15"))
+FAILURE_BACKOFF_MAX_HOURS = float(os.getenv("FAILURE_BACKOFF_MAX_HOURS", "6"))
+
+# HTTP-клиент парсеров: таймаут запроса (с), число повторов при 429/5xx,
+# базовая задержка между повторами (с) и размер пула соединений на хост
+# (не меньше одновременных запросов к одному сайту, см. http_client.pool_size)
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "8"))
+
+# Ограничение запросов к одному сайту: начальная скорость (запросов в секунду,
+# 0 — без ограничения), допустимый всплеск и пределы, в которых скорость
+# подстраивается под ответы сайта
+RATE_LIMIT = float(os.getenv("RATE_LIMIT", "4"))
+RATE_BURST = float(os.getenv("RATE_BURST", "4"))
+RATE_LIMIT_MIN = float(os.getenv("RATE_LIMIT_MIN", "0.2"))
+RATE_LIMIT_MAX = float(os.getenv("RATE_LIMIT_MAX", "12"))
+
+# Helix: размер страницы каталога (API может урезать его до своего максимума)
+# и число страниц, которые качаются одновременно
+HELIX_PAGE_SIZE = int(os.getenv("HELIX_PAGE_SIZE", "100"))
+HELIX_PAGE_WINDOW = int(os.getenv("HELIX_PAGE_WINDOW", "4"))
+
+# Гемотест: сколько страниц каталога качается одновременно и предел числа
+# страниц на город (разделы находятся по ссылкам каталога)
+GEMOTEST_PAGE_WINDOW = int(os.getenv("GEMOTEST_PAGE_WINDOW", "4"))
+GEMOTEST_MAX_PAGES = int(os.getenv("GEMOTEST_MAX_PAGES", "300"))
+# Когда пользователь ждёт первых данных города, бот качает только
+# GEMOTEST_FIRST_PAGES страниц, а остальной каталог дособирает в фоне
+GEMOTEST_FIRST_PAGES = int(os.getenv("GEMOTEST_FIRST_PAGES", "3"))
+
+# Разбор HTML-страниц: lxml или bs4 (BeautifulSoup + html.parser);
+# пусто — lxml, если установлен
+HTML_BACKEND = os.getenv("HTML_BACKEND", "")
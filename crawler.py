@@ -0,0 +1,144 @@
+import argparse
+import logging
+import time
+from collections import deque
+from urllib.parse import urlsplit
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import config
+from cities import cities
+from freshness import freshness_tracker
+from parsers.gemotest_parser import parse_gemotest_for_city
+from parsers.http_client import get_stats
+from parsers.ratelimit import backlog
+from parsers.helix import load_helix_cities, parse_helix
+from parsers.invitro_parser import parse_invitro_for_city
+
+PARSERS = {
+    "invitro": lambda city_name, helix_cities: parse_invitro_for_city(city_name),
+    "gemotest": lambda city_name, helix_cities: parse_gemotest_for_city(city_name),
+    "helix": lambda city_name, helix_cities: parse_helix(city_name, helix_cities),
+}
+
+# Быстрый первый парсинг, пока пользователь ждёт: только первые страницы
+# каталога, остальное дособирается полным парсингом в фоне
+QUICK_PARSERS = {
+    "gemotest": lambda city_name, helix_cities: parse_gemotest_for_city(city_name, config.GEMOTEST_FIRST_PAGES),
+}
+
+# Сайт каждой лаборатории: по нему смотрим очередь ограничителя скорости
+HOSTS = {
+    "invitro": urlsplit(config.INVITRO_URL).hostname,
+    "gemotest": urlsplit(config.GEMOTEST_URL).hostname,
+    "helix": urlsplit(config.HELIX_URL).hostname,
+}
+
+def is_supported(city_info, lab):
+    value = city_info.get(lab)
+    return value is not None and str(value).strip() != "-"
+
+def scrape(lab, city_name, helix_cities, quick=False):
+    # Исход парсинга записывается в freshness: и бот, и обход видят одни сроки.
+    # Быстрый парсинг свежим пару не делает, её дособирает полный
+    partial = quick and lab in QUICK_PARSERS
+    parser = QUICK_PARSERS[lab] if partial else PARSERS[lab]
+    return freshness_tracker.scrape(lab, city_name, parser, city_name, helix_cities, partial=partial)
+
+def crawl(labs=tuple(PARSERS), city_names=None, workers=None, per_host=None, helix_cities=None, only_stale=False):
+    """Обходит все пары лаборатория × город пулом потоков.
+
+    К одному сайту одновременно идёт не больше per_host парсингов, задачи
+    раздаются по кругу между сайтами, чтобы пул был занят, а ни один сайт
+    не получал всю нагрузку сразу. Сайт, запросы к которому уже ждут
+    ограничителя скорости, новые задачи получает в последнюю очередь:
+    поток всё равно простоял бы в ожидании. only_stale — только пары,
+    которые пора обновить по freshness. Возвращает статистику по лабораториям.
+    """
+    workers = workers or config.CRAWL_WORKERS
+    per_host = per_host or config.CRAWL_PER_HOST
+    if helix_cities is None and "helix" in labs:
+        helix_cities = load_helix_cities("helix_cities.json")
+    city_names = city_names or list(cities)
+
+    pairs = [(lab, c) for lab in labs for c in city_names if is_supported(cities[c], lab)]
+    if only_stale:
+        pairs = freshness_tracker.stale_pairs(pairs)
+    queues = {lab: deque(c for pair_lab, c in pairs if pair_lab == lab) for lab in labs}
+    total = sum(len(queue) for queue in queues.values())
+    stats = {lab: {"updated": 0, "unchanged": 0, "empty": 0, "failed": 0} for lab in labs}
+    in_flight = {lab: 0 for lab in labs}
+    order = deque(labs)
+    running = {}
+    done = 0
+    start = time.monotonic()
+
+    def next_lab():
+        ready = [lab for lab in order if queues[lab] and in_flight[lab] < per_host]
+        idle = [lab for lab in ready if not backlog(HOSTS[lab])]
+        lab = (idle or ready or [None])[0]
+        if lab is not None:
+            # Выбранный сайт уходит в конец круга
+            order.remove(lab)
+            order.append(lab)
+        return lab
+
+    logging.info(f"Обход: {total} пар лаборатория × город, потоков {workers}, на сайт {per_host}")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while running or any(queues.values()):
+            while len(running) < workers:
+                lab = next_lab()
+                if lab is None:
+                    break
+                city_name = queues[lab].popleft()
+                future = pool.submit(scrape, lab, city_name, helix_cities)
+                running[future] = (lab, city_name)
+                in_flight[lab] += 1
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                lab, city_name = running.pop(future)
+                in_flight[lab] -= 1
+                done += 1
+                try:
+                    merge = future.result()
+                except Exception as e:
+                    stats[lab]["failed"] += 1
+                    status = f"ошибка: {e}"
+                else:
+                    if merge is None:
+                        stats[lab]["empty"] += 1
+                        status = "нет данных"
+                    elif merge.written:
+                        stats[lab]["updated"] += 1
+                        status = f"добавлено {len(merge.added)}, изменено {len(merge.updated)}"
+                    else:
+                        stats[lab]["unchanged"] += 1
+                        status = "без изменений"
+
+                elapsed = time.monotonic() - start
+                eta = elapsed / done * (total - done)
+                logging.info(f"[{done}/{total}] {lab} {city_name}: {status}; "
+                             f"прошло {elapsed:.0f} с, осталось ~{eta:.0f} с")
+
+    elapsed = time.monotonic() - start
+    logging.info(f"Обход завершён за {elapsed:.0f} с: {stats}")
+    for host, counters in get_stats().items():
+        logging.info(f"HTTP {host}: {counters['requests'] / max(elapsed, 1e-9):.1f} запросов/с, {counters}")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Обход всех городов всех лабораторий")
+    parser.add_argument("--labs", default=",".join(PARSERS), help="лаборатории через запятую")
+    parser.add_argument("--cities", help="города через запятую, по умолчанию все")
+    parser.add_argument("--workers", type=int, default=config.CRAWL_WORKERS)
+    parser.add_argument("--per-host", type=int, default=config.CRAWL_PER_HOST)
+    parser.add_argument("--only-stale", action="store_true", help="только устаревшие и ещё не собранные пары")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    city_names = [c.strip() for c in args.cities.split(",")] if args.cities else None
+    crawl(tuple(args.labs.split(",")), city_names, args.workers, args.per_host, only_stale=args.only_stale)
+
+if __name__ == "__main__":
+    main()
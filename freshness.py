@@ -0,0 +1,155 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import config
+from catalog import catalog_path, normalize_city_filename
+
+# age — часы с последнего успешного парсинга (None — данных нет),
+# fresh — данные моложе срока лаборатории,
+# retry_in — сколько секунд ещё не повторять парсинг после неудачи
+Status = namedtuple('Status', ['age', 'fresh', 'retry_in'])
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS freshness (key TEXT PRIMARY KEY, entry TEXT NOT NULL);"
+
+class FreshnessTracker:
+    """Когда каждая пара (лаборатория, город) последний раз успешно обновлялась.
+
+    Время хранится отдельно от mtime файла в SQLite, DATA_DIR/freshness.db:
+    mtime меняют и копирование, и ручная правка. Базу пишут и бот, и ночной
+    обход, каждое изменение записи — одна транзакция. Для пар без записи
+    берётся mtime CSV.
+    Неудачные парсинги тоже записываются, чтобы недоступный сайт не дёргали
+    на каждое сообщение. Быстрый парсинг первых страниц записывается как
+    частичный: пара остаётся устаревшей, пока не пройдёт полный.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._local = threading.local()
+
+    def _file(self):
+        return self.path or os.path.join(config.DATA_DIR, "freshness.db")
+
+    def _connect(self):
+        # Соединение на поток; DATA_DIR может смениться (замеры, проверки)
+        path = self._file()
+        if getattr(self._local, "path", None) != path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._import_json(conn, os.path.splitext(path)[0] + ".json")
+            self._local.conn, self._local.path = conn, path
+        return self._local.conn
+
+    @staticmethod
+    def _import_json(conn, legacy_path):
+        # Записи из прежнего freshness.json переносятся в пустую базу
+        if conn.execute("SELECT 1 FROM freshness LIMIT 1").fetchone():
+            return
+        try:
+            with open(legacy_path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR IGNORE INTO freshness (key, entry) VALUES (?, ?)",
+                [(key, json.dumps(entry, ensure_ascii=False)) for key, entry in entries.items()],
+            )
+
+    @staticmethod
+    def _entry(conn, key):
+        row = conn.execute("SELECT entry FROM freshness WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _update(self, lab, city_key, fields):
+        # fields(старая запись) -> новые поля. BEGIN IMMEDIATE сразу берёт
+        # блокировку записи: другой процесс не вклинится между чтением и записью
+        conn = self._connect()
+        key = f"{lab}/{city_key}"
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            entry = self._entry(conn, key)
+            conn.execute(
+                "INSERT INTO freshness (key, entry) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET entry = excluded.entry",
+                (key, json.dumps(dict(entry, **fields(entry)), ensure_ascii=False)),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def record_success(self, lab, city_key):
+        self._update(lab, city_key, lambda entry: {
+            "success": time.time(), "partial": None, "failures": 0, "error": None,
+        })
+
+    def record_partial(self, lab, city_key):
+        self._update(lab, city_key, lambda entry: {"partial": time.time()})
+
+    def record_failure(self, lab, city_key, error):
+        self._update(lab, city_key, lambda entry: {
+            "failed": time.time(), "failures": entry.get("failures", 0) + 1, "error": str(error),
+        })
+
+    def status(self, lab, city_key, now=None):
+        now = now or time.time()
+        path = catalog_path(lab, normalize_city_filename(city_key))
+        entry = self._entry(self._connect(), f"{lab}/{city_key}")
+
+        success = None
+        if os.path.exists(path):
+            success = entry.get("success") or os.path.getmtime(path)
+        # После частичного парсинга в каталоге только часть позиций
+        partial = entry.get("partial")
+        if success and partial:
+            success = partial
+        age = (now - success) / 3600 if success else None
+
+        retry_in = 0
+        if entry.get("failures"):
+            backoff = min(config.FAILURE_BACKOFF_MIN * 60 * 2 ** (entry["failures"] - 1),
+                          config.FAILURE_BACKOFF_MAX_HOURS * 3600)
+            retry_in = max(0, entry["failed"] + backoff - now)
+
+        ttl = config.LAB_TTL_HOURS.get(lab, config.DATA_MAX_AGE_HOURS)
+        return Status(age, age is not None and age < ttl and not partial, retry_in)
+
+    def needs_refresh(self, lab, city_key, ahead_hours=0, now=None):
+        """Данные устарели (или устареют за ahead_hours часов), а повтор после неудачи уже разрешён"""
+        status = self.status(lab, city_key, now)
+        ttl = config.LAB_TTL_HOURS.get(lab, config.DATA_MAX_AGE_HOURS)
+        expiring = not status.fresh or status.age >= ttl - ahead_hours
+        return expiring and not status.retry_in
+
+    def stale_pairs(self, pairs, ahead_hours=0):
+        """Пары (лаборатория, город) из pairs, которые пора обновить"""
+        now = time.time()
+        return [(lab, city_key) for lab, city_key in pairs if self.needs_refresh(lab, city_key, ahead_hours, now)]
+
+    def scrape(self, lab, city_key, func, *args, partial=False):
+        """Запускает парсер и записывает исход: None от парсера — тоже неудача.
+
+        partial — парсер собрал не весь каталог, успех записывается как частичный.
+        """
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.record_failure(lab, city_key, e)
+            raise
+        if result is None:
+            self.record_failure(lab, city_key, "нет данных")
+        elif partial:
+            self.record_partial(lab, city_key)
+        else:
+            self.record_success(lab, city_key)
+        return result
+
+freshness_tracker = FreshnessTracker()
@@ -1,21 +1,11 @@
-import os
-import datetime
-from parsers.invitro_parser import parse_invitro_for_city
-from parsers.gemotest_parser import parse_all_gemotest
-from parsers.helix import parse_helix, load_helix_cities
+from parsers.helix import load_helix_cities
+from catalog import normalize_city_filename
+from basket import optimize_basket
 from comparator import compare_analyses
+from crawler import scrape
+from freshness import freshness_tracker
 from cities import cities
 
-def normalize_city_filename(city_name: str) -> str:
-    return city_name.lower().replace(" ", "-").replace("ё", "е")
-
-def is_file_fresh(filepath):
-    if not os.path.exists(filepath):
-        return False
-    modified_time = datetime.datetime.fromtimestamp(os.path.getmtime(filepath))
-    now = datetime.datetime.now()
-    return modified_time.date() == now.date()
-
 def main():
     helix_cities = load_helix_cities("helix_cities.json")
 
@@ -37,38 +27,49 @@ def main():
 
     city_filename = normalize_city_filename(city_name)
 
-    invitro_path = f"data/invitro_{city_filename}.csv"
-    gemotest_path = f"data/gemotest_{city_filename}.csv"
-    helix_path = f"data/helix_{city_filename}.csv"
-
     msg = ""
 
     if not invitro_slug or invitro_slug == "-":
         msg += f"Нет данных Invitro для города {city_name}\n"
     else:
-        if not is_file_fresh(invitro_path):
+        if freshness_tracker.needs_refresh("invitro", city_name):
             msg += f"Сбор информации Invitro для города: {city_name}...\n"
-            parse_invitro_for_city(city_name)
+            scrape("invitro", city_name, helix_cities)
 
     if not gemotest_slug or gemotest_slug == "-":
         msg += f"Нет данных Gemotest для города {city_name}\n"
     else:
-        if not is_file_fresh(gemotest_path):
+        if freshness_tracker.needs_refresh("gemotest", city_name):
             msg += f"Сбор информации Gemotest для города: {city_name}...\n"
-            parse_all_gemotest(city_name)
+            scrape("gemotest", city_name, helix_cities)
 
     if not helix_id or helix_id == "-":
         msg += f"Нет данных Helix для города {city_name}\n"
     else:
-        if not is_file_fresh(helix_path):
+        if freshness_tracker.needs_refresh("helix", city_name):
             msg += f"Сбор информации Helix для города: {city_name}...\n"
-            parse_helix(city_name, helix_cities)
+            scrape("helix", city_name, helix_cities)
 
     if msg:
         print(msg.strip())
 
     analysis_names = input("\nВведите названия анализов через запятую для сравнения: ").split(",")
-    compare_analyses([x.strip() for x in analysis_names], city_filename)
+    results = compare_analyses([x.strip() for x in analysis_names], city_filename, helix_cities)
+    for r in results:
+        cheapest = r["cheapest"]
+        if cheapest["lab"]:
+            print(f"{r['user_input']}: дешевле всего {cheapest['lab']} — {cheapest['price']:.0f} ₽ ({cheapest['link']})")
+        else:
+            print(f"{r['user_input']}: нет данных")
+
+    if len(results) > 1:
+        basket = optimize_basket(results)
+        if basket["single"]:
+            print(f"\nВесь список в одной лаборатории: {basket['single']['lab']} — {basket['single']['total']:.0f} ₽")
+        if basket["split"] and len(basket["split"]["visits"]) > 1:
+            print(f"Дешевле разделить: {basket['split']['total']:.0f} ₽")
+            for lab, names in basket["split"]["visits"].items():
+                print(f"  {lab}: {', '.join(names)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,189 @@
+import sys
+import numpy as np
+from fuzzywuzzy import fuzz, utils
+from rapidfuzz import fuzz as rapid_fuzz
+
+# Запас к верхним оценкам: fuzzywuzzy округляет промежуточные оценки WRatio,
+# вместе это меньше единицы
+SLACK = 1.0
+
+def _partial_bound(common, len_a, len_b):
+    # partial_ratio сравнивает короткую строку с отрезком длинной не длиннее её:
+    # совпадений не больше общих символов, поэтому оценка не выше 2C / (l + C)
+    shorter = np.minimum(len_a, len_b)
+    common = np.minimum(common, shorter)
+    return 2.0 * common / np.maximum(shorter + common, 1)
+
+def _ratio_bound(common, len_a, len_b):
+    # ratio = 2 * (длина общей подпоследовательности) / (сумма длин)
+    common = np.minimum(common, np.minimum(len_a, len_b))
+    return 2.0 * common / np.maximum(len_a + len_b, 1)
+
+def process_title(title):
+    # Так process.extractOne обрабатывает варианты выбора: один проход с force_ascii
+    return utils.full_process(str(title), force_ascii=True)
+
+def process_query(query):
+    # А запрос — два прохода: сначала обычный, затем с force_ascii. Символы
+    # вроде «» и ° первым проходом заменяются пробелами, а не удаляются,
+    # поэтому в запросе остаются двойные пробелы
+    return utils.full_process(utils.full_process(query), force_ascii=True)
+
+class TitleIndex:
+    """Поиск названия каталога с тем же ответом, что у process.extractOne с WRatio.
+
+    Запрос и названия обрабатываются так же, как в extractOne (process_query
+    и process_title). Точный WRatio fuzzywuzzy дорогой, поэтому названия отсеиваются двумя
+    верхними оценками. Первая считается сразу для всего каталога по составу
+    символов и слов (numpy). Вторая — WRatio из rapidfuzz: он устроен так же,
+    но partial_ratio ищет лучший отрезок среди всех и промежуточные оценки
+    не округляются, поэтому он не меньше оценки fuzzywuzzy за вычетом SLACK.
+    Названия проверяются по убыванию оценки, пока они ещё могут обогнать
+    лучший результат или сравняться с ним раньше по порядку. Поэтому при
+    равных оценках, как и у extractOne, выбирается первое название.
+    """
+
+    def __init__(self, titles):
+        self.titles = list(titles)
+        # Та же предобработка, что делает process.extractOne для WRatio
+        self._processed = [process_title(t) for t in self.titles]
+
+        alphabet = {}
+        for processed in self._processed:
+            for ch in processed:
+                if ch != " ":
+                    alphabet.setdefault(ch, len(alphabet))
+        self._alphabet = alphabet
+
+        n = len(self.titles)
+        chars = np.zeros((n, max(len(alphabet), 1)), dtype=np.uint16)
+        stats = np.zeros((6, n), dtype=np.int32)
+        postings = {}
+        for i, processed in enumerate(self._processed):
+            for ch in processed:
+                if ch != " ":
+                    chars[i, alphabet[ch]] += 1
+            stats[:, i] = self._stats(processed)
+            for token in set(processed.split()):
+                postings.setdefault(token, []).append(i)
+        self._chars = chars
+        (self._len, self._letters, self._spaces,
+         self._tokens, self._set_tokens, self._set_len) = stats
+        self._postings = {token: np.array(ids, dtype=np.int32) for token, ids in postings.items()}
+
+    @staticmethod
+    def _stats(processed):
+        # Пробелы считаются все, в том числе идущие подряд: ratio и partial_ratio
+        # сравнивают строки как есть, а token_* — слова через один пробел
+        tokens = processed.split()
+        unique = set(tokens)
+        letters = len(processed) - processed.count(" ")
+        set_len = sum(map(len, unique)) + max(len(unique) - 1, 0)
+        return len(processed), letters, processed.count(" "), len(tokens), len(unique), set_len
+
+    def upper_bounds(self, processed_query):
+        """Быстрая верхняя оценка WRatio запроса с каждым названием каталога"""
+        length, letters, spaces, tokens, set_tokens, set_len = self._stats(processed_query)
+        n = len(self.titles)
+
+        # Общие символы без пробелов — по счётчикам символов
+        query_chars = {}
+        for ch in processed_query:
+            col = self._alphabet.get(ch)
+            if col is not None:
+                query_chars[col] = query_chars.get(col, 0) + 1
+        if query_chars:
+            cols = np.fromiter(query_chars, dtype=np.int64)
+            counts = np.fromiter(query_chars.values(), dtype=np.uint16)
+            common = np.minimum(self._chars[:, cols], counts).sum(axis=1, dtype=np.int64)
+        else:
+            common = np.zeros(n, dtype=np.int64)
+
+        # Длина общих слов (строка sorted_sect в token_set_ratio)
+        sect_len = np.zeros(n, dtype=np.int64)
+        for token in set(processed_query.split()):
+            ids = self._postings.get(token)
+            if ids is not None:
+                sect_len[ids] += len(token) + 1
+        shared = sect_len > 0
+        sect_len = np.where(shared, sect_len - 1, 0)
+
+        # ratio по обработанным строкам
+        base = _ratio_bound(common + np.minimum(self._spaces, spaces), self._len, length)
+
+        # Строки из отсортированных слов и из множеств слов
+        sort_len = self._letters + np.maximum(self._tokens - 1, 0)
+        sort_common = common + np.maximum(np.minimum(self._tokens, tokens) - 1, 0)
+        query_sort_len = letters + max(tokens - 1, 0)
+        set_common = common + np.maximum(np.minimum(self._set_tokens, set_tokens) - 1, 0)
+
+        # Без частичных сравнений: token_sort_ratio и token_set_ratio.
+        # У token_set_ratio отношения пересечения к обеим объединённым
+        # строкам считаются точно: пересечение — их начало
+        token_sort = _ratio_bound(sort_common, sort_len, query_sort_len)
+        token_set = np.maximum.reduce([
+            2.0 * sect_len / np.maximum(sect_len + set_len, 1),
+            2.0 * sect_len / np.maximum(sect_len + self._set_len, 1),
+            _ratio_bound(set_common, self._set_len, set_len),
+        ])
+        whole = np.maximum(base, 0.95 * np.maximum(token_sort, token_set))
+
+        # С частичными сравнениями: partial_token_set_ratio равен 100,
+        # если есть общее слово
+        partial = np.maximum.reduce([
+            _partial_bound(common + np.minimum(self._spaces, spaces), self._len, length),
+            0.95 * _partial_bound(sort_common, sort_len, query_sort_len),
+            0.95 * np.where(shared, 1.0, _partial_bound(set_common, self._set_len, set_len)),
+        ])
+        shorter = np.maximum(np.minimum(self._len, length), 1)
+        len_ratio = np.maximum(self._len, length) / shorter
+        scale = np.where(len_ratio > 8, 0.6, 0.9)
+        partial = np.maximum(base, scale * partial)
+
+        bounds = 100.0 * np.where(len_ratio < 1.5, whole, partial) + SLACK
+        # WRatio с пустой строкой равен 0
+        return np.where((self._len > 0) & (length > 0), bounds, 0.0)
+
+    def _extract(self, processed_query, threshold):
+        if not processed_query:
+            return None
+        bounds = self.upper_bounds(processed_query)
+        ids = np.flatnonzero(bounds >= threshold)
+        # При равных оценках сначала более ранние названия
+        order = ids[np.argsort(-bounds[ids], kind="stable")]
+
+        best_id, best_score = None, threshold
+        for i, bound in zip(order.tolist(), bounds[order].tolist()):
+            # Дальше оценки только ниже: даже равный результат уже невозможен
+            if bound < best_score:
+                break
+            # Более позднее название может только обогнать лучший результат
+            need = best_score + 1 if best_id is not None and i > best_id else best_score
+            if bound < need:
+                continue
+            processed = self._processed[i]
+            if rapid_fuzz.WRatio(processed_query, processed, score_cutoff=need - SLACK) + SLACK < need:
+                continue
+            score = fuzz.WRatio(processed_query, processed, full_process=False)
+            if score >= need:
+                best_id, best_score = i, score
+        return None if best_id is None else self.titles[best_id]
+
+    def extract_many(self, queries, threshold=60):
+        """Лучшее название для каждого запроса (или None), как у extractOne с порогом"""
+        return [self._extract(process_query(q), threshold) for q in queries]
+
+    def extract_one(self, query, threshold=60):
+        return self.extract_many([query], threshold)[0]
+
+    def score(self, query, title):
+        return fuzz.WRatio(process_query(query), process_title(title), full_process=False)
+
+    def memory_usage(self):
+        """Примерный объём индекса в байтах"""
+        size = self._chars.nbytes + 6 * self._len.nbytes
+        for strings in (self.titles, self._processed):
+            size += sys.getsizeof(strings) + sum(sys.getsizeof(s) for s in strings)
+        size += sys.getsizeof(self._postings)
+        size += sum(sys.getsizeof(token) + ids.nbytes + 112 for token, ids in self._postings.items())
+        return size
@@ -0,0 +1,106 @@
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.dammit import UnicodeDammit
+
+import config
+
+# lxml разбирает HTML в разы быстрее BeautifulSoup, но не обязателен
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+class SoupBackend:
+    """BeautifulSoup с html.parser; SoupStrainer оставляет в дереве только карточки"""
+
+    def document(self, content, item_class=None):
+        # Без item_class дерево строится целиком — нужно, чтобы собрать ссылки.
+        # При разборе class ещё не разбит на слова: "analyzes-item analyzes-item--hit"
+        # целиком со строкой item_class не совпадает
+        strainer = None
+        if item_class:
+            strainer = SoupStrainer(class_=lambda value: value is not None and item_class in value.split())
+        return BeautifulSoup(content, "html.parser", parse_only=strainer)
+
+    def cards(self, doc, item_class):
+        return doc.find_all(class_=item_class)
+
+    def links(self, doc):
+        return [a['href'] for a in doc.find_all('a', href=True)]
+
+    def find(self, node, class_name, tag=None):
+        return node.find(tag, class_=class_name)
+
+    def first_link(self, node, container_class):
+        # То же, что node.select_one('.container_class a')
+        for container in node.find_all(class_=container_class):
+            link = container.find('a')
+            if link:
+                return link
+        return None
+
+    def text(self, node):
+        return node.text
+
+    def get(self, node, attr, default=None):
+        return node.get(attr, default)
+
+class LxmlBackend:
+    """Разбор напрямую через lxml.html и XPath, результат тот же, что у SoupBackend"""
+
+    _by_class = "descendant::{tag}[contains(concat(' ', normalize-space(@class), ' '), concat(' ', $cls, ' '))]"
+
+    def __init__(self):
+        self._xpaths = {}
+
+    def _xpath(self, tag):
+        xpath = self._xpaths.get(tag)
+        if xpath is None:
+            xpath = self._xpaths[tag] = etree.XPath(self._by_class.format(tag=tag))
+        return xpath
+
+    def document(self, content, item_class=None):
+        # Кодировку определяем так же, как BeautifulSoup
+        if isinstance(content, bytes):
+            content = UnicodeDammit(content, is_html=True).unicode_markup
+        root = lxml.html.document_fromstring(content)
+        # get_text у BeautifulSoup не включает содержимое script/style/template
+        etree.strip_elements(root, "script", "style", "template", with_tail=False)
+        return root
+
+    def cards(self, doc, item_class):
+        return self._xpath("*")(doc, cls=item_class)
+
+    def links(self, doc):
+        # smart_strings=False: строки не держат ссылку на всё дерево
+        return doc.xpath("//a/@href", smart_strings=False)
+
+    def find(self, node, class_name, tag=None):
+        found = self._xpath(tag or "*")(node, cls=class_name)
+        return found[0] if found else None
+
+    def first_link(self, node, container_class):
+        for container in self._xpath("*")(node, cls=container_class):
+            links = container.xpath("descendant::a")
+            if links:
+                return links[0]
+        return None
+
+    def text(self, node):
+        return node.text_content()
+
+    def get(self, node, attr, default=None):
+        return node.get(attr, default)
+
+BACKENDS = {"bs4": SoupBackend}
+if lxml is not None:
+    BACKENDS["lxml"] = LxmlBackend
+
+_backends = {}
+
+def get_backend(name=None):
+    name = name or config.HTML_BACKEND or ("lxml" if "lxml" in BACKENDS else "bs4")
+    backend = _backends.get(name)
+    if backend is None:
+        backend = _backends[name] = BACKENDS[name]()
+    return backend
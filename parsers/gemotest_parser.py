@@ -1,89 +1,150 @@
-import requests
-from bs4 import BeautifulSoup
 import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit
+import config
 from cities import cities
-from utils import update_or_add_products
+from utils import CatalogSink, MergeResult, normalize_rows
+from parsers.http_client import ValidatorBatch
+from parsers.extract import get_backend
 
-BASE_URL = "https://gemotest.ru"
+BASE_URL = config.GEMOTEST_URL
 HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
 
 
-def parse_city_gemotest(city_name, city_slug):
+# Разделы, с которых начинается обход; остальные находятся по ссылкам
+CATEGORY_SEEDS = ("", "issledovaniya-krovi/gormony/", "issledovaniya-krovi/biokhimiya/")
+# Постраничная навигация Битрикса: ?PAGEN_1=2
+PAGE_PARAM = re.compile(r"^PAGEN_\d+$")
+
+
+def catalog_url(href, catalog_path, page_url):
+    """Ссылка со страницы page_url -> адрес страницы каталога города или None,
+    если ссылка ведёт за его пределы"""
+    parts = urlsplit(urljoin(page_url, href))
+    if parts.netloc != urlsplit(BASE_URL).netloc or not parts.path.startswith(catalog_path):
+        return None
+    path = parts.path if parts.path.endswith("/") else parts.path + "/"
+    # Из параметров оставляем только номер страницы (первая — это сам раздел),
+    # остальное — фильтры и метки
+    pages = [(name, value) for name, value in parse_qsl(parts.query)
+             if PAGE_PARAM.match(name) and value != "1"]
+    return BASE_URL + path + ("?" + urlencode(pages) if pages else "")
+
+
+def fetch_gemotest_page(url, catalog_path, batch):
+    """(строки, ссылки на разделы и страницы) одной страницы каталога.
+
+    Для неизменившейся страницы строк нет (None), а ссылки берутся сохранённые.
+    """
+    resp = batch.get(url, headers=HEADERS)
+    if resp.unchanged:
+        return None, batch.noted(resp, "links", [])
+
+    html = get_backend()
+    doc = html.document(resp.content)
+    rows = list(gemotest_rows(html, doc))
+    # Ссылки карточек ведут на сами анализы, а не на разделы
+    items = {catalog_url(row["link"], catalog_path, url) for row in rows}
+    links = []
+    for href in html.links(doc):
+        link = catalog_url(href, catalog_path, url)
+        if link and link != url and link not in items and link not in links:
+            links.append(link)
+    batch.note(resp, links=links)
+    return rows, links
+
+
+def parse_city_gemotest(city_name, city_slug, batch=None, max_pages=None):
+    """Генератор строк анализов города по найденным страницам каталога, не больше max_pages"""
     print(f"\n[Гемотест] Парсинг {city_name}")
-
-    base_url = f"{BASE_URL}/{city_slug}/catalog"
-    urls = [
-        f"{base_url}/",
-        f"{base_url}/issledovaniya-krovi/gormony/",
-        f"{base_url}/issledovaniya-krovi/biokhimiya/"
-    ]
-
-    results = []
-
-    for url in urls:
-        try:
-            resp = requests.get(url, headers=HEADERS, timeout=10)
-            resp.raise_for_status()
-        except Exception as e:
-            print(f"[Ошибка] Не удалось загрузить: {url} → {e}")
-            continue
-
-        soup = BeautifulSoup(resp.content, 'html.parser')
-        items = soup.select('.analysis-item')
-
-        for item in items:
-            title = item.get('data-eec-name', '').strip()
-            link_part = item.select_one('a.analysis-item__title')
-            link = BASE_URL + link_part['href'] if link_part and link_part.has_attr('href') else ''
-            price = item.get('data-eec-price', '').strip() + ' ₽' if item.get('data-eec-price') else ''
-
-            if title:
-                results.append({
-                    'title': title,
-                    'link': link,
-                    'description': '',
-                    'price': price
-                })
-
-    print(f"— Найдено {len(results)} анализов в {city_name}")
-    return results
-
-
-def parse_all_gemotest():
-    os.makedirs("data", exist_ok=True)
-
-    for city_name, city_info in cities.items():
-        city_slug = city_info.get("gemotest")
-        if not city_slug or city_slug.strip() == "-":
-            print(f"[!] Пропуск {city_name} — нет слуга для Гемотеста")
-            continue
-
-        rus_slug = city_info.get("slug", city_name.lower().replace(" ", "-"))
-
-        analyses = parse_city_gemotest(city_name, city_slug)
-
-        if analyses:
-            filepath = os.path.join("data", f"gemotest_{rus_slug}.csv")
-            update_or_add_products(analyses, filepath)
-            print(f"[✓] Сохранено в {filepath}")
-        else:
-            print(f"[!] Нет данных для {city_name}")
-
-
-def parse_all_gemotest(city_name):
+    max_pages = max_pages or config.GEMOTEST_MAX_PAGES
+
+    catalog_path = f"/{city_slug}/catalog/"
+    pending = deque(BASE_URL + catalog_path + seed for seed in CATEGORY_SEEDS[:max_pages])
+    queued = set(pending)
+    seen_items = set()
+    count = 0
+    batch = batch or ValidatorBatch(enabled=False)
+
+    # Страницы качаются окном из GEMOTEST_PAGE_WINDOW запросов и разбираются
+    # по порядку; новые разделы и страницы встают в конец очереди
+    with ThreadPoolExecutor(max_workers=config.GEMOTEST_PAGE_WINDOW) as pool:
+        window = deque()
+        while pending or window:
+            while pending and len(window) < config.GEMOTEST_PAGE_WINDOW:
+                url = pending.popleft()
+                window.append((url, pool.submit(fetch_gemotest_page, url, catalog_path, batch)))
+
+            url, future = window.popleft()
+            try:
+                rows, links = future.result()
+            except Exception as e:
+                print(f"[Ошибка] Не удалось загрузить: {url} → {e}")
+                continue
+
+            for link in links:
+                if link not in queued and len(queued) < max_pages:
+                    queued.add(link)
+                    pending.append(link)
+
+            # Строки неизменившейся страницы уже лежат в CSV: слияние их не удаляет.
+            # Один анализ бывает в нескольких разделах — отдаём его один раз
+            for row in rows or ():
+                key = row["link"] or row["title"]
+                if key not in seen_items:
+                    seen_items.add(key)
+                    count += 1
+                    yield row
+
+    print(f"— Найдено {count} анализов в {city_name}, страниц каталога: {len(queued)}")
+
+
+def gemotest_rows(html, doc):
+    for item in html.cards(doc, 'analysis-item'):
+        title = html.get(item, 'data-eec-name', '').strip()
+        link_part = html.find(item, 'analysis-item__title', 'a')
+        href = html.get(link_part, 'href') if link_part is not None else None
+        link = BASE_URL + href if href is not None else ''
+        price = html.get(item, 'data-eec-price', '').strip() + ' ₽' if html.get(item, 'data-eec-price') else ''
+
+        if title:
+            yield {
+                'title': title,
+                'link': link,
+                'description': '',
+                'price': price
+            }
+
+
+def extract_gemotest(content, backend=None):
+    html = get_backend(backend)
+    return gemotest_rows(html, html.document(content, 'analysis-item'))
+
+
+def parse_gemotest_for_city(city_name, max_pages=None):
     city_info = cities.get(city_name)
     if not city_info or city_info.get("gemotest") in [None, "-"]:
         print(f"[!] Город '{city_name}' не поддерживается Гемотестом.")
         return
 
     city_slug = city_info["gemotest"]
-    rus_slug = city_info.get("slug", city_name.lower().replace(" ", "-"))
-
-    analyses = parse_city_gemotest(city_name, city_slug)
-    if analyses:
-        os.makedirs("data", exist_ok=True)
-        filepath = os.path.join("data", f"gemotest_{rus_slug}.csv")
-        update_or_add_products(analyses, filepath)
-        print(f"[✓] Данные Гемотеста сохранены в {filepath}")
-    else:
-        print(f"[!] Нет данных Гемотеста для {city_name}")
+    rus_slug = city_info.get("slug", city_name.lower().replace(" ", "-").replace("ё", "е"))
+
+    os.makedirs(config.DATA_DIR, exist_ok=True)
+    filepath = os.path.join(config.DATA_DIR, f"gemotest_{rus_slug}.csv")
+
+    batch = ValidatorBatch(filepath, enabled=os.path.exists(filepath))
+    with CatalogSink(filepath) as sink:
+        sink.extend(normalize_rows(parse_city_gemotest(city_name, city_slug, batch, max_pages)))
+        if batch.unchanged:
+            print(f"[=] Данные Гемотеста для {city_name} не изменились")
+            return MergeResult([], [], False)
+        if sink.count:
+            merge = sink.commit()
+            batch.commit()
+            print(f"[✓] Данные Гемотеста сохранены в {filepath}")
+            return merge
+        else:
+            print(f"[!] Нет данных Гемотеста для {city_name}")
@@ -1,9 +1,15 @@
 import json
 import os
-import requests
-from utils import update_or_add_products
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import config
+from utils import CatalogSink, MergeResult, normalize_rows
+from parsers.http_client import ValidatorBatch
 from cities import cities  # твой словарь городов с id Helix
 
+BASE_URL = config.HELIX_URL
+
 def load_helix_cities(filename="helix_cities.json"):
     if not os.path.exists(filename):
         print(f"Файл {filename} не найден.")
@@ -24,85 +30,115 @@ def get_helix_alias(city_id, helix_cities):
                 return slug
     return None
 
-def parse_helix(city_name, helix_cities):
-    city_info = cities.get(city_name)
-    if not city_info or city_info.get("helix") in [None, "-"]:
-        print(f"[!] Город '{city_name}' не поддерживается Helix.")
-        return
-
-    city_id = city_info["helix"]
-    city_slug = get_helix_alias(city_id, helix_cities)
-    if not city_slug:
-        print(f"[!] Не удалось получить alias для города с id={city_id}.")
-        return
-
-    category_id = 190
-    take = 12
-    skip = 0
-    base_url = "https://helix.ru/api/catalog/items/list/v2"
-    all_items = []
+CATEGORY_ID = 190
 
-    # Первый запрос, чтобы узнать total
+def fetch_helix_page(city_id, skip, take, batch):
     params = {
         "cityId": city_id,
-        "filter.categoryId": category_id,
+        "filter.categoryId": CATEGORY_ID,
         "pagination.take": take,
         "pagination.skip": skip,
     }
-
+    return batch.get(f"{BASE_URL}/api/catalog/items/list/v2", params=params).json()
+
+def helix_rows(items, city_slug):
+    for item in items:
+        hxid = item.get("hxid")
+        yield {
+            "title": item.get("title"),
+            "link": f"{BASE_URL}/{city_slug}/catalog/item/{hxid}",
+            "price": str(item.get("price")),
+        }
+
+def parse_city_helix(city_name, city_id, city_slug, batch=None):
+    """Генератор строк анализов города: страницы API отдаются по мере загрузки"""
+    take = config.HELIX_PAGE_SIZE
+    batch = batch or ValidatorBatch(enabled=False)
+
+    # Первая страница сразу идёт в результат, заодно из неё узнаём total
     try:
-        r = requests.get(base_url, params=params)
-        r.raise_for_status()
-        data = r.json()
+        data = fetch_helix_page(city_id, 0, take, batch)
     except Exception as e:
         print(f"Ошибка при получении данных для города {city_name}: {e}")
         return
 
     total = data.get("total", 0)
-    if total == 0:
+    first_items = data.get("catalogItems", [])
+    if total == 0 or not first_items:
         print("Нет анализов. Пропускаем.")
         return
 
     print(f"Всего анализов: {total}")
 
-    while skip < total:
-        params["pagination.skip"] = skip
-        try:
-            r = requests.get(base_url, params=params)
-            r.raise_for_status()
-            data = r.json()
-        except Exception as e:
-            print(f"Ошибка на skip={skip}: {e}")
-            break
-
-        items = data.get("catalogItems", [])
-        if not items:
-            print("catalogItems пустой. Прерываем.")
-            break
-
-        for item in items:
-            hxid = item.get("hxid")
-            title = item.get("title")
-            price = item.get("price")
-            url = f"https://helix.ru/{city_slug}/catalog/item/{hxid}"
-
-            all_items.append({
-                "title": title,
-                "link": url,
-                "price": str(price)
-            })
-
-        print(f"Парсим записи: {skip + 1} - {skip + len(items)}")
-        skip += take
-
-    if all_items:
-        os.makedirs("data", exist_ok=True)
-        filename = city_name.lower().replace(" ", "-").replace("ё", "е")
-        filepath = f"data/helix_{filename}.csv"
-        update_or_add_products(all_items, filepath)
-        print(f"Сохранено: {filepath}")
-    else:
-        print("Не удалось собрать ни одного анализа.")
+    # API может урезать take до своего максимума — дальше шагаем фактическим размером страницы
+    if len(first_items) < min(take, total):
+        take = len(first_items)
+
+    yield from helix_rows(first_items, city_slug)
+    skips = iter(range(take, total, take))
+
+    # Остальные страницы качаем параллельно скользящим окном из HELIX_PAGE_WINDOW
+    # запросов, а отдаём строго по порядку; в памяти не больше окна страниц.
+    # На первой ошибке прекращаем, как и раньше
+    with ThreadPoolExecutor(max_workers=config.HELIX_PAGE_WINDOW) as pool:
+        def submit(skip):
+            window.append((skip, pool.submit(fetch_helix_page, city_id, skip, take, batch)))
+
+        window = deque()
+        for skip in islice(skips, config.HELIX_PAGE_WINDOW):
+            submit(skip)
+        while window:
+            skip, future = window.popleft()
+            try:
+                items = future.result().get("catalogItems", [])
+            except Exception as e:
+                print(f"Ошибка на skip={skip}: {e}")
+                items = None
+            if not items:
+                if items is not None:
+                    print("catalogItems пустой. Прерываем.")
+                for _, pending in window:
+                    pending.cancel()
+                break
+
+            next_skip = next(skips, None)
+            if next_skip is not None:
+                submit(next_skip)
+            yield from helix_rows(items, city_slug)
+            print(f"Парсим записи: {skip + 1} - {skip + len(items)}")
+
+def parse_helix(city_name, helix_cities):
+    city_info = cities.get(city_name)
+    if not city_info or city_info.get("helix") in [None, "-"]:
+        print(f"[!] Город '{city_name}' не поддерживается Helix.")
+        return
+
+    city_id = city_info["helix"]
+    city_slug = get_helix_alias(city_id, helix_cities)
+    if not city_slug:
+        print(f"[!] Не удалось получить alias для города с id={city_id}.")
+        return
+
+    os.makedirs(config.DATA_DIR, exist_ok=True)
+    filename = city_name.lower().replace(" ", "-").replace("ё", "е")
+    filepath = os.path.join(config.DATA_DIR, f"helix_{filename}.csv")
+
+    # Первая страница нужна ради total, поэтому 304 от API не просим,
+    # а неизменность определяем по хешу ответов
+    batch = ValidatorBatch(filepath, enabled=os.path.exists(filepath), send_validators=False)
+    with CatalogSink(filepath) as sink:
+        sink.extend(normalize_rows(parse_city_helix(city_name, city_id, city_slug, batch)))
+        if sink.count and batch.unchanged:
+            print(f"Данные Helix для {city_name} не изменились")
+            return MergeResult([], [], False)
+
+        if sink.count:
+            merge = sink.commit()
+            batch.commit()
+            print(f"Сохранено: {filepath}")
+            return merge
+        else:
+            print("Не удалось собрать ни одного анализа.")
 
 if __name__ == "__main__":
     helix_cities = load_helix_cities("helix_cities.json")
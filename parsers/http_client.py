@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+from parsers.ratelimit import get_limiter, get_limiter_stats
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Ответы, которыми сайт просит снизить нагрузку
+THROTTLE_STATUSES = (429, 503)
+
+_sessions = {}
+_lock = threading.Lock()
+_stats = defaultdict(lambda: {"requests": 0, "retries": 0, "errors": 0, "bytes": 0, "not_modified": 0})
+
+class _CountingRetry(Retry):
+    # urllib3 повторяет запросы сам, поэтому повторы считаем здесь
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if _pool is not None:
+            with _lock:
+                _stats[_pool.host]["retries"] += 1
+            # Каждый 429/503, в том числе повторный, замедляет весь хост
+            limiter = get_limiter(_pool.host)
+            if limiter and response is not None and response.status in THROTTLE_STATUSES:
+                limiter.throttle(self.get_retry_after(response))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+def pool_size():
+    """Соединений в пуле хоста: столько запросов к одному сайту может идти сразу.
+
+    Парсингов одного сайта одновременно не больше CRAWL_PER_HOST в обходе
+    и SCRAPE_WORKERS в боте, и каждый качает окно страниц. Лишние соединения
+    сверх пула urllib3 закрывает, и keep-alive для них теряется.
+    """
+    window = max(config.GEMOTEST_PAGE_WINDOW, config.HELIX_PAGE_WINDOW)
+    return max(config.HTTP_POOL_SIZE, max(config.CRAWL_PER_HOST, config.SCRAPE_WORKERS) * window)
+
+def _make_session():
+    retry = _CountingRetry(
+        total=config.HTTP_RETRIES,
+        backoff_factor=config.HTTP_BACKOFF,
+        backoff_jitter=config.HTTP_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size(), max_retries=retry)
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def get_session(url):
+    """Общая сессия для хоста: keep-alive и пул соединений на все парсеры"""
+    host = urlsplit(url).hostname
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = _sessions[host] = _make_session()
+    return session
+
+def http_get(url, **kwargs):
+    host = urlsplit(url).hostname
+    kwargs.setdefault("timeout", config.HTTP_TIMEOUT)
+    limiter = get_limiter(host)
+    if limiter:
+        limiter.acquire()
+    with _lock:
+        _stats[host]["requests"] += 1
+    try:
+        response = get_session(url).get(url, **kwargs)
+    except requests.RequestException:
+        with _lock:
+            _stats[host]["errors"] += 1
+        raise
+    with _lock:
+        _stats[host]["bytes"] += len(response.content)
+        if response.status_code >= 400:
+            _stats[host]["errors"] += 1
+    # 429/503 уже учтены в повторах, а время ответа после повторов включает паузы между ними
+    retries = getattr(response.raw, "retries", None)
+    if limiter and response.status_code not in THROTTLE_STATUSES and not (retries and retries.history):
+        limiter.record(response.elapsed.total_seconds())
+    return response
+
+def get_stats():
+    """Счётчики по хостам: запросы, повторы, ошибки, байты и работа ограничителя скорости"""
+    limits = get_limiter_stats()
+    with _lock:
+        return {host: dict(counters, **limits.get(host, {})) for host, counters in _stats.items()}
+
+def _validators_path(catalog):
+    # Свой файл у каждого каталога (лаборатория, город): в памяти только
+    # валидаторы текущего обновления, а запись не задевает другие города
+    name = os.path.splitext(os.path.basename(catalog))[0]
+    return os.path.join(config.DATA_DIR, "http_validators", name + ".json")
+
+class ValidatorBatch:
+    """Условные запросы одного обновления (ETag, Last-Modified, хеш тела).
+
+    catalog — файл каталога, рядом с которым хранятся его валидаторы
+    (None — не хранить). Валидаторы сохраняются только через commit(), то есть
+    после успешной записи данных: если запись не удалась, следующий запрос
+    снова скачает страницу целиком.
+    enabled=False — просто собирать валидаторы (например, CSV ещё нет);
+    send_validators=False — не слать заголовки, а сравнивать только хеш тела.
+    К странице можно приложить свои данные через note(): они сохраняются вместе
+    с валидаторами и доступны через noted(), когда страница пришла как 304.
+    """
+
+    def __init__(self, catalog=None, enabled=True, send_validators=True):
+        self.path = _validators_path(catalog) if catalog else None
+        self.enabled = enabled
+        self.send_validators = send_validators
+        self._known = None
+        self._fetched = {}
+        self._verified = True
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        key = requests.Request("GET", url, params=kwargs.get("params")).prepare().url
+        with self._lock:
+            known = self._load().get(key, {})
+
+        if self.enabled and self.send_validators:
+            headers = dict(kwargs.pop("headers", None) or {})
+            if known.get("etag"):
+                headers["If-None-Match"] = known["etag"]
+            if known.get("last_modified"):
+                headers["If-Modified-Since"] = known["last_modified"]
+            kwargs["headers"] = headers
+
+        try:
+            response = http_get(url, **kwargs)
+            if response.status_code != 304:
+                response.raise_for_status()
+        except Exception:
+            # Непроверенная страница: считать обновление «без изменений» нельзя
+            with self._lock:
+                self._verified = False
+            raise
+
+        response.validator_key = key
+        if response.status_code == 304:
+            response.unchanged = True
+        else:
+            # Данные из note() переносим: при совпадении хеша страницу не разбирают заново
+            entry = dict(
+                known,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                hash=hashlib.sha256(response.content).hexdigest(),
+            )
+            response.unchanged = self.enabled and entry["hash"] == known.get("hash")
+            with self._lock:
+                self._fetched[key] = entry
+
+        with self._lock:
+            self._fetched.setdefault(key, known)
+            if not response.unchanged:
+                self._verified = False
+        if response.unchanged:
+            with _lock:
+                _stats[urlsplit(url).hostname]["not_modified"] += 1
+        return response
+
+    def _load(self):
+        # Вызывается под self._lock
+        if self._known is None:
+            self._known = {}
+            if self.path:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        self._known = json.load(f)
+                except (OSError, ValueError):
+                    pass
+        return self._known
+
+    def note(self, response, **data):
+        with self._lock:
+            self._fetched[response.validator_key] = dict(self._fetched[response.validator_key], **data)
+
+    def noted(self, response, name, default=None):
+        with self._lock:
+            return self._fetched[response.validator_key].get(name, default)
+
+    @property
+    def unchanged(self):
+        """Все страницы обновления загружены и не изменились с прошлого раза"""
+        with self._lock:
+            return self.enabled and bool(self._fetched) and self._verified
+
+    def commit(self):
+        if not self.path:
+            return
+        with self._lock:
+            validators = dict(self._load(), **self._fetched)
+        # Файл пишется без общих замков: счётчики http_get его не ждут
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(validators, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -1,69 +1,57 @@
-import requests
-from bs4 import BeautifulSoup
 import os
+import config
 from cities import cities
-from utils import update_or_add_products
+from utils import CatalogSink, MergeResult, normalize_rows
 from urllib.parse import quote
+from parsers.http_client import ValidatorBatch
+from parsers.extract import get_backend
 
-BASE_URL = "https://www.invitro.ru"
+BASE_URL = config.INVITRO_URL
 HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
 
-def parse_city_invitro(city_name, city_slug):
+def parse_city_invitro(city_name, city_slug, batch=None):
+    """Генератор строк анализов города"""
     url = f"{BASE_URL}/analizes/for-doctors/{quote(city_slug)}/"
     print(f"\n[Invitro] Парсинг {city_name}: {url}")
 
+    batch = batch or ValidatorBatch(enabled=False)
     try:
-        response = requests.get(url, headers=HEADERS, timeout=10)
-        response.raise_for_status()
+        response = batch.get(url, headers=HEADERS)
     except Exception as e:
         print(f"Ошибка при загрузке страницы {url}: {e}")
-        return []
+        return
+
+    if response.unchanged:
+        print(f"— Страница не изменилась: {url}")
+        return
+
+    count = 0
+    for row in extract_invitro(response.content):
+        count += 1
+        yield row
 
-    soup = BeautifulSoup(response.content, "html.parser")
-    items = soup.select('.analyzes-item')
+    print(f"— Найдено {count} анализов в {city_name}")
 
-    results = []
-    for item in items:
-        title_elem = item.select_one('.analyzes-item__title a')
-        desc_elem = item.select_one('.analyzes-item__description')
-        price_elem = item.select_one('.analyzes-item__total--sum')
+def extract_invitro(content, backend=None):
+    html = get_backend(backend)
+    for item in html.cards(html.document(content, 'analyzes-item'), 'analyzes-item'):
+        title_elem = html.first_link(item, 'analyzes-item__title')
+        desc_elem = html.find(item, 'analyzes-item__description')
+        price_elem = html.find(item, 'analyzes-item__total--sum')
 
-        title = title_elem.text.strip() if title_elem else ''
-        link = BASE_URL + title_elem['href'] if title_elem and title_elem.has_attr('href') else ''
-        description = desc_elem.text.strip() if desc_elem else ''
-        price = price_elem.text.strip() if price_elem else ''
+        href = html.get(title_elem, 'href') if title_elem is not None else None
+        title = html.text(title_elem).strip() if title_elem is not None else ''
+        link = BASE_URL + href if href is not None else ''
+        description = html.text(desc_elem).strip() if desc_elem is not None else ''
+        price = html.text(price_elem).strip() if price_elem is not None else ''
 
         if title:
-            results.append({
+            yield {
                 'title': title,
                 'link': link,
                 'description': description,
                 'price': price
-            })
-
-    print(f"— Найдено {len(results)} анализов в {city_name}")
-    return results
-
-
-def parse_all_invitro():
-    os.makedirs("data", exist_ok=True)
-
-    for city_name, city_info in cities.items():
-        city_slug = city_info.get("invitro")
-        if not city_slug or city_slug.strip() == "-":
-            print(f"[!] Пропуск {city_name} — нет слуга для Invitro")
-            continue
-
-        rus_slug = city_info.get("slug", city_name.lower())  # русская транскрипция для имени файла
-
-        analyses = parse_city_invitro(city_name, city_slug)
-
-        if analyses:
-            filepath = os.path.join("data", f"invitro_{rus_slug}.csv")
-            update_or_add_products(analyses, filepath)
-            print(f"[✓] Сохранено в {filepath}")
-        else:
-            print(f"[!] Нет данных для {city_name}")
+            }
 
 
 def parse_invitro_for_city(city_name):
@@ -77,11 +65,20 @@ def parse_invitro_for_city(city_name):
     if not rus_slug:
         rus_slug = city_name.lower().replace(" ", "-").replace("ё", "е")
 
-    analyses = parse_city_invitro(city_name, city_slug)
-    if analyses:
-        os.makedirs("data", exist_ok=True)
-        filepath = os.path.join("data", f"invitro_{rus_slug}.csv")
-        update_or_add_products(analyses, filepath)
-        print(f"[✓] Данные Invitro сохранены в {filepath}")
-    else:
-        print(f"[!] Нет данных Invitro для {city_name}")
+    os.makedirs(config.DATA_DIR, exist_ok=True)
+    filepath = os.path.join(config.DATA_DIR, f"invitro_{rus_slug}.csv")
+
+    # Условный запрос имеет смысл, только если есть что оставить как есть
+    batch = ValidatorBatch(filepath, enabled=os.path.exists(filepath))
+    with CatalogSink(filepath) as sink:
+        sink.extend(normalize_rows(parse_city_invitro(city_name, city_slug, batch)))
+        if batch.unchanged:
+            print(f"[=] Данные Invitro для {city_name} не изменились")
+            return MergeResult([], [], False)
+        if sink.count:
+            merge = sink.commit()
+            batch.commit()
+            print(f"[✓] Данные Invitro сохранены в {filepath}")
+            return merge
+        else:
+            print(f"[!] Нет данных Invitro для {city_name}")
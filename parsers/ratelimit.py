@@ -0,0 +1,112 @@
+import threading
+import time
+
+import config
+
+# Скорость растёт на INCREASE запросов в секунду после каждого нормального ответа
+# и падает в DECREASE раз на 429/503 или резком росте времени ответа (AIMD)
+INCREASE = 0.1
+DECREASE = 0.5
+# Ответ считается всплеском, если он в LATENCY_SPIKE раз медленнее среднего
+# и дольше LATENCY_FLOOR секунд
+LATENCY_SPIKE = 3.0
+LATENCY_FLOOR = 0.5
+# Пачка одновременных 429 — это один сигнал: снижаем не чаще раза в DECREASE_INTERVAL секунд
+DECREASE_INTERVAL = 1.0
+
+class HostLimiter:
+    """Корзина токенов одного хоста с адаптивной скоростью"""
+
+    def __init__(self, rate=None, burst=None, min_rate=None, max_rate=None):
+        self.rate = rate or config.RATE_LIMIT
+        self.burst = burst or config.RATE_BURST
+        self.min_rate = min_rate or config.RATE_LIMIT_MIN
+        self.max_rate = max(max_rate or config.RATE_LIMIT_MAX, self.rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.waiting = 0
+        self.latency = None
+        self.decreased = float("-inf")
+        self.stats = {"waits": 0, "wait_time": 0.0, "throttled": 0, "slowdowns": 0}
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Ждёт свободный токен; возвращает время ожидания в секундах"""
+        with self._cond:
+            start = now = time.monotonic()
+            self._refill(now)
+            if self.tokens < 1:
+                self.stats["waits"] += 1
+            self.waiting += 1
+            try:
+                while True:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        break
+                    self._cond.wait((1 - self.tokens) / self.rate)
+                    now = time.monotonic()
+            finally:
+                self.waiting -= 1
+            self.stats["wait_time"] += now - start
+            return now - start
+
+    def _slow_down(self):
+        now = time.monotonic()
+        if now - self.decreased < DECREASE_INTERVAL:
+            return
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate * DECREASE)
+        self.decreased = now
+        self.stats["slowdowns"] += 1
+
+    def record(self, latency):
+        """Нормальный ответ: разгоняемся, если сайт не начал отвечать заметно медленнее"""
+        with self._cond:
+            if self.latency is not None and latency > max(self.latency * LATENCY_SPIKE, LATENCY_FLOOR):
+                self._slow_down()
+            else:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + INCREASE)
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+    def throttle(self, retry_after=None):
+        """Сайт ответил 429/503: снижаем скорость, а по Retry-After ставим хост на паузу"""
+        with self._cond:
+            self.stats["throttled"] += 1
+            self._slow_down()
+            if retry_after:
+                # Отрицательный запас токенов — пауза для всех потоков этого хоста
+                self.tokens = min(self.tokens, 1 - retry_after * self.rate)
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.stats, rate=round(self.rate, 2), wait_time=round(self.stats["wait_time"], 2))
+
+_limiters = {}
+_lock = threading.Lock()
+
+def get_limiter(host):
+    """Общий ограничитель хоста для всех парсеров; None, если RATE_LIMIT=0"""
+    if config.RATE_LIMIT <= 0:
+        return None
+    with _lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = HostLimiter()
+    return limiter
+
+def backlog(host):
+    """Сколько запросов к хосту сейчас ждут токена"""
+    with _lock:
+        limiter = _limiters.get(host)
+    return limiter.waiting if limiter else 0
+
+def get_limiter_stats():
+    with _lock:
+        limiters = dict(_limiters)
+    return {host: limiter.snapshot() for host, limiter in limiters.items()}
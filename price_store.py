@@ -0,0 +1,153 @@
+import glob
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS labs (
+    id INTEGER PRIMARY KEY,
+    code TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS cities (
+    id INTEGER PRIMARY KEY,
+    slug TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    title_lower TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS prices (
+    city_id INTEGER NOT NULL REFERENCES cities(id),
+    lab_id INTEGER NOT NULL REFERENCES labs(id),
+    analysis_id INTEGER NOT NULL REFERENCES analyses(id),
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    title_lower TEXT NOT NULL,
+    link TEXT,
+    description TEXT,
+    price TEXT,
+    price_value REAL,
+    currency TEXT,
+    price_ok INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_prices_city_lab_title ON prices(city_id, lab_id, title_lower);
+CREATE INDEX IF NOT EXISTS idx_prices_analysis ON prices(analysis_id);
+CREATE TABLE IF NOT EXISTS catalogs (
+    city_id INTEGER NOT NULL REFERENCES cities(id),
+    lab_id INTEGER NOT NULL REFERENCES labs(id),
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (city_id, lab_id)
+);
+"""
+
+COLUMNS = ["title", "link", "description", "price", "price_value", "currency", "price_ok"]
+
+class PriceStore:
+    """Единое хранилище цен всех лабораторий и городов в SQLite (режим WAL).
+
+    У каждого потока своё соединение с одной и той же базой, так что хранилище
+    можно делить между ботом и пакетными парсерами.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _id(self, conn, table, column, value):
+        conn.execute(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", (value,))
+        return conn.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,)).fetchone()[0]
+
+    def replace_catalog(self, lab, city, df):
+        # Весь каталог пары (лаборатория, город) заменяется в одной транзакции:
+        # читатели видят либо старые цены, либо новые целиком
+        df = df.reindex(columns=COLUMNS)
+        df = df.astype(object).where(df.notna(), None)
+        with self._connect() as conn:
+            lab_id = self._id(conn, "labs", "code", lab)
+            city_id = self._id(conn, "cities", "slug", city)
+            conn.execute("DELETE FROM prices WHERE city_id = ? AND lab_id = ?", (city_id, lab_id))
+
+            titles_lower = [str(title).lower() for title in df["title"]]
+            conn.executemany("INSERT OR IGNORE INTO analyses (title_lower) VALUES (?)",
+                             [(t,) for t in set(titles_lower)])
+            conn.executemany(
+                "INSERT INTO prices (city_id, lab_id, analysis_id, position, title, title_lower, "
+                "link, description, price, price_value, currency, price_ok) "
+                "SELECT ?, ?, id, ?, ?, ?, ?, ?, ?, ?, ?, ? FROM analyses WHERE title_lower = ?",
+                [(city_id, lab_id, position, row[0], title_lower, *row[1:], title_lower)
+                 for position, (row, title_lower) in enumerate(zip(df.itertuples(index=False), titles_lower))],
+            )
+            conn.execute(
+                "INSERT INTO catalogs (city_id, lab_id, version, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (city_id, lab_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+                (city_id, lab_id, time.time()),
+            )
+
+    def catalog_version(self, lab, city):
+        row = self._connect().execute(
+            "SELECT c.version FROM catalogs c JOIN labs l ON l.id = c.lab_id JOIN cities ci ON ci.id = c.city_id "
+            "WHERE l.code = ? AND ci.slug = ?", (lab, city)).fetchone()
+        return row[0] if row else None
+
+    def load_catalog(self, lab, city):
+        df = pd.read_sql_query(
+            "SELECT p.title, p.link, p.description, p.price, p.price_value, p.currency, p.price_ok "
+            "FROM prices p JOIN labs l ON l.id = p.lab_id JOIN cities c ON c.id = p.city_id "
+            "WHERE l.code = ? AND c.slug = ? ORDER BY p.position",
+            self._connect(), params=(lab, city))
+        # Колонка из одних NULL приходит как object, а сравнение ждёт числа
+        df["price_value"] = pd.to_numeric(df["price_value"])
+        return df
+
+    def find_in_cities(self, title_lower):
+        # Цены одного анализа во всех городах и лабораториях, от дешёвых к дорогим
+        return pd.read_sql_query(
+            "SELECT c.slug AS city, l.code AS lab, p.title, p.link, p.price_value "
+            "FROM analyses a JOIN prices p ON p.analysis_id = a.id "
+            "JOIN labs l ON l.id = p.lab_id JOIN cities c ON c.id = p.city_id "
+            "WHERE a.title_lower = ? ORDER BY p.price_value",
+            self._connect(), params=(title_lower.lower(),))
+
+    def import_csv(self, csv_path):
+        lab, city = split_catalog_path(csv_path)
+        self.replace_catalog(lab, city, pd.read_csv(csv_path, encoding='utf-8-sig'))
+
+def split_catalog_path(csv_path):
+    # data/{лаборатория}_{город}.csv -> (лаборатория, город)
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    lab, _, city = name.partition("_")
+    return lab, city
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_price_store():
+    global _store
+    with _store_lock:
+        path = config.PRICE_DB or os.path.join(config.DATA_DIR, "prices.db")
+        if _store is None or _store.path != path:
+            _store = PriceStore(path)
+        return _store
+
+if __name__ == "__main__":
+    # Перенос уже собранных CSV в базу
+    store = get_price_store()
+    for path in sorted(glob.glob(os.path.join(config.DATA_DIR, "*_*.csv"))):
+        store.import_csv(path)
+        print(f"Импортирован {path}")
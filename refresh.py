@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+
+class RefreshCoordinator:
+    """Объединяет одновременные обновления одной пары (лаборатория, город) в один парсинг.
+
+    Парсинги идут в собственном пуле из max_workers потоков: долгие обходы
+    сайтов не занимают общий пул asyncio.to_thread, где идут сравнения.
+    """
+
+    def __init__(self, max_workers=None):
+        self._inflight = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or config.SCRAPE_WORKERS, thread_name_prefix="scrape"
+        )
+
+    async def run(self, lab, city_key, func, *args):
+        key = (lab, city_key)
+        task = self._inflight.get(key)
+        if task is None:
+            logging.info(f"Запуск обновления {lab} для города {city_key}")
+            task = asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            logging.info(f"Обновление {lab} для города {city_key} уже идёт, ожидаем его")
+        # shield — отмена одного ожидающего не должна отменять общий парсинг
+        return await asyncio.shield(task)
+
+    def shutdown(self):
+        # Ещё не начатые парсинги отменяются, идущие дорабатывают сами
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Забираем исключение, даже если ожидающих уже не осталось
+        if not task.cancelled():
+            task.exception()
+
+
+class RefreshScheduler:
+    """Фоновое обновление: популярные города обновляются до того, как данные устареют.
+
+    Популярность — число запросов города, которое каждые half_life часов
+    уменьшается вдвое. За один проход обновляется не больше per_tick городов,
+    самые популярные первыми.
+    """
+
+    def __init__(self, refresh_city, stale_labs, interval=None, half_life=None, per_tick=None):
+        # refresh_city(city_key, labs) — корутина обновления,
+        # stale_labs(city_keys) — {город: лаборатории, чьи данные скоро устареют}
+        self.refresh_city = refresh_city
+        self.stale_labs = stale_labs
+        self.interval = interval or config.REFRESH_INTERVAL_MIN * 60
+        self.half_life = (half_life or config.POPULARITY_HALF_LIFE_HOURS) * 3600
+        self.per_tick = per_tick or config.REFRESH_CITIES_PER_TICK
+        self.popularity = {}
+        self._decayed_at = time.monotonic()
+
+    def _decay(self):
+        now = time.monotonic()
+        factor = 0.5 ** ((now - self._decayed_at) / self.half_life)
+        self._decayed_at = now
+        self.popularity = {city: score * factor for city, score in self.popularity.items() if score * factor >= 0.01}
+
+    def record_query(self, city_key):
+        self._decay()
+        self.popularity[city_key] = self.popularity.get(city_key, 0) + 1
+
+    def queue(self):
+        """Города в порядке убывания популярности"""
+        self._decay()
+        return sorted(self.popularity, key=self.popularity.get, reverse=True)
+
+    async def tick(self):
+        queue = self.queue()
+        stale = self.stale_labs(queue)
+        refreshed = 0
+        for city_key in queue:
+            if refreshed >= self.per_tick:
+                break
+            labs = stale.get(city_key)
+            if not labs:
+                continue
+            refreshed += 1
+            logging.info(f"Фоновое обновление {', '.join(labs)} для города {city_key}")
+            try:
+                await self.refresh_city(city_key, labs)
+            except Exception:
+                logging.exception(f"Фоновое обновление города {city_key} не удалось")
+        return refreshed
+
+    async def run(self):
+        while True:
+            await self.tick()
+            await asyncio.sleep(self.interval)
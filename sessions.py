@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    user_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at);
+"""
+
+# Просроченные диалоги вычищаются при каждой EVICT_EVERY-й записи
+EVICT_EVERY = 100
+
+def add_analyses(state, new_analyses, limit=None):
+    """Добавляет анализы в диалог: без повторов, не больше limit последних"""
+    limit = limit or config.SESSION_MAX_ANALYSES
+    merged = {}
+    for name in state.get("analyses", []) + list(new_analyses):
+        # Повтор переносит анализ в конец, чтобы при обрезке он остался
+        merged.pop(name.lower(), None)
+        merged[name.lower()] = name
+    state["analyses"] = list(merged.values())[-limit:]
+    # Результаты вытесненных анализов больше не нужны
+    if "results" in state:
+        keep = {name.lower() for name in state["analyses"]}
+        state["results"] = {key: result for key, result in state["results"].items() if key in keep}
+    return state
+
+class MemorySessionStore:
+    """Диалоги в памяти процесса: теряются при перезапуске, годятся для одного воркера"""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or config.SESSION_TTL_HOURS * 3600
+        self._sessions = {}
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return None
+            if time.time() - entry[1] > self.ttl:
+                del self._sessions[user_id]
+                return None
+            return entry[0]
+
+    def set(self, user_id, state):
+        with self._lock:
+            self._sessions[user_id] = (state, time.time())
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict_locked()
+
+    def delete(self, user_id):
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+    def evict_expired(self):
+        with self._lock:
+            return self._evict_locked()
+
+    def _evict_locked(self):
+        deadline = time.time() - self.ttl
+        expired = [user_id for user_id, (_, updated) in self._sessions.items() if updated < deadline]
+        for user_id in expired:
+            del self._sessions[user_id]
+        return len(expired)
+
+class SQLiteSessionStore:
+    """Диалоги в SQLite (режим WAL): переживают перезапуск и общие для нескольких воркеров.
+
+    При shards > 1 пользователи раскладываются по нескольким файлам базы
+    по user_id, чтобы воркеры реже ждали друг друга на записи.
+    """
+
+    def __init__(self, path, ttl=None, shards=1):
+        self.path = path
+        self.ttl = ttl or config.SESSION_TTL_HOURS * 3600
+        self.shards = max(1, shards)
+        self._writes = 0
+        self._local = threading.local()
+        for shard in range(self.shards):
+            with self._connect(shard) as conn:
+                conn.executescript(SCHEMA)
+
+    def _shard_path(self, shard):
+        if self.shards == 1:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        return f"{root}-{shard}{ext}"
+
+    def _connect(self, shard):
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get(shard)
+        if conn is None:
+            path = self._shard_path(shard)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = sqlite3.connect(path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conns[shard] = conn
+        return conn
+
+    def _shard(self, user_id):
+        return zlib.crc32(str(user_id).encode()) % self.shards
+
+    def get(self, user_id):
+        with self._connect(self._shard(user_id)) as conn:
+            row = conn.execute(
+                "SELECT state FROM sessions WHERE user_id = ? AND updated_at >= ?",
+                (user_id, time.time() - self.ttl),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, user_id, state):
+        with self._connect(self._shard(user_id)) as conn:
+            conn.execute(
+                "INSERT INTO sessions (user_id, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (user_id, json.dumps(state, ensure_ascii=False), time.time()),
+            )
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self.evict_expired()
+
+    def delete(self, user_id):
+        with self._connect(self._shard(user_id)) as conn:
+            conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    def evict_expired(self):
+        evicted = 0
+        for shard in range(self.shards):
+            with self._connect(shard) as conn:
+                evicted += conn.execute(
+                    "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,)
+                ).rowcount
+        return evicted
+
+class AsyncSessionStore:
+    """Асинхронная обёртка хранилища для бота.
+
+    Вызовы идут через asyncio.to_thread: ожидание блокировки SQLite, общей
+    для нескольких воркеров, не останавливает цикл событий для всех чатов.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    async def get(self, user_id):
+        return await asyncio.to_thread(self.store.get, user_id)
+
+    async def set(self, user_id, state):
+        await asyncio.to_thread(self.store.set, user_id, state)
+
+    async def delete(self, user_id):
+        await asyncio.to_thread(self.store.delete, user_id)
+
+def get_session_store():
+    if config.SESSION_STORE == "sqlite":
+        path = config.SESSION_DB or os.path.join(config.DATA_DIR, "sessions.db")
+        return SQLiteSessionStore(path, shards=config.SESSION_SHARDS)
+    return MemorySessionStore()
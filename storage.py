@@ -0,0 +1,83 @@
+import logging
+import os
+import pandas as pd
+import config
+from price_store import get_price_store, split_catalog_path
+
+# pyarrow нужен только для колоночных форматов, CSV работает и без него
+try:
+    import pyarrow.feather as feather
+    import pyarrow.parquet as parquet
+except ImportError:
+    feather = None
+    parquet = None
+
+# arrow — Feather v2 без сжатия, читается через memory map почти без копирования
+EXTENSIONS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+_warned = False
+
+def backend():
+    global _warned
+    name = config.CATALOG_BACKEND
+    if name in ("csv", "sqlite"):
+        return name
+    if name not in EXTENSIONS:
+        raise ValueError(f"Неизвестный формат хранения каталогов: {name}")
+    if feather is None:
+        if not _warned:
+            logging.warning(f"pyarrow не установлен, формат {name} недоступен, используется CSV")
+            _warned = True
+        return "csv"
+    return name
+
+def binary_path(csv_path, name):
+    return os.path.splitext(csv_path)[0] + EXTENSIONS[name]
+
+def write_catalog_copy(csv_path, name=None):
+    # CSV остаётся основным файлом для людей, копия уходит в колоночный файл или в SQLite.
+    # Копия строится из только что записанного CSV, чтобы типы колонок совпадали
+    name = name or backend()
+    if name == "csv":
+        return
+    df = pd.read_csv(csv_path, encoding='utf-8-sig')
+    if name == "sqlite":
+        get_price_store().replace_catalog(*split_catalog_path(csv_path), df)
+        return
+    path = binary_path(csv_path, name)
+    tmp_path = path + ".tmp"
+    if name == "arrow":
+        feather.write_feather(df, tmp_path, compression="uncompressed")
+    else:
+        df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+def catalog_version(csv_path, name=None):
+    """Метка версии каталога для кэша; FileNotFoundError, если каталога нет"""
+    name = name or backend()
+    if name == "sqlite":
+        store = get_price_store()
+        version = store.catalog_version(*split_catalog_path(csv_path))
+        if version is None and os.path.exists(csv_path):
+            # CSV собран до перехода на SQLite и ещё не перенесён в базу
+            logging.info(f"Перенос {csv_path} в базу цен")
+            store.import_csv(csv_path)
+            version = store.catalog_version(*split_catalog_path(csv_path))
+        if version is None:
+            raise FileNotFoundError(csv_path)
+        return version
+    stat = os.stat(csv_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def read_catalog(csv_path, name=None):
+    name = name or backend()
+    if name == "sqlite":
+        return get_price_store().load_catalog(*split_catalog_path(csv_path))
+    if name != "csv":
+        path = binary_path(csv_path, name)
+        # Копия старше CSV (например, CSV поправили руками) не используется
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(csv_path):
+            if name == "arrow":
+                return feather.read_table(path, memory_map=True).to_pandas()
+            return parquet.read_table(path, memory_map=True).to_pandas()
+    return pd.read_csv(csv_path, encoding='utf-8-sig')
@@ -4,7 +4,7 @@ from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, fil
 from cities import cities
 from comparator import compare_analyses
 from parsers.invitro_parser import parse_invitro_for_city
-from parsers.gemotest_parser import parse_all_gemotest
+from parsers.gemotest_parser import parse_gemotest_for_city
 from parsers.helix import parse_helix
 import os
 import datetime
@@ -136,7 +136,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if gemotest_slug and gemotest_slug != "-":
                 if not is_file_fresh(gemotest_path):
                     logging.info(f"Обновление Gemotest для города {city_key}")
-                    parse_all_gemotest(city_key)
+                    parse_gemotest_for_city(city_key)
 
             if helix_id and helix_id != "-":
                 if not is_file_fresh(helix_path):
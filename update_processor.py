@@ -0,0 +1,58 @@
+import asyncio
+import sys
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов с сохранением порядка внутри одного чата.
+
+    Апдейты разных пользователей идут одновременно (не больше
+    max_concurrent_updates), а апдейты одного пользователя — строго по очереди:
+    следующее сообщение не обгонит долгое сравнение предыдущего.
+
+    process_update базового класса PTB не переопределяется: его семафор
+    создаётся без ограничения, а очередь пользователя и свой семафор
+    на max_concurrent_updates слотов работают в do_process_update.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(sys.maxsize)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        # ключ -> [замок, число апдейтов, которые его держат или ждут]
+        self._locks = {}
+
+    @staticmethod
+    def _key(update):
+        if isinstance(update, Update):
+            if update.effective_user:
+                return ("user", update.effective_user.id)
+            if update.effective_chat:
+                return ("chat", update.effective_chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # Очередь пользователя ждёт до общего семафора,
+            # чтобы один болтливый чат не занимал все слоты
+            async with entry[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
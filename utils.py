@@ -1,42 +1,217 @@
 import csv
+import json
 import os
+import re
+import sqlite3
+import tempfile
+import threading
+from collections import namedtuple
+from storage import write_catalog_copy
 
-def update_or_add_products(new_data, filename):
-    if not new_data:
-        print("Нет новых данных для обновления.")
-        return
+# Числовая цена сохраняется при парсинге, чтобы не разбирать строки при каждом запросе
+PRICE_FIELDS = ['price_value', 'currency', 'price_ok']
+CURRENCIES = {'₽': 'RUB', 'руб': 'RUB', '$': 'USD', '€': 'EUR'}
+DEFAULT_CURRENCY = 'RUB'
 
-    if not os.path.exists(filename):
-        with open(filename, 'w', encoding='utf-8-sig', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=new_data[0].keys())
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+def file_lock(filename):
+    # Один замок на файл: две записи одного CSV не должны пересекаться
+    path = os.path.abspath(filename)
+    with _file_locks_guard:
+        lock = _file_locks.get(path)
+        if lock is None:
+            lock = _file_locks[path] = threading.Lock()
+    return lock
+
+def normalize_price(price):
+    """'1 234 ₽' -> (1234.0, 'RUB', True), нераспознанная цена -> (None, валюта, False)"""
+    if isinstance(price, bytes):
+        price = price.decode('utf-8')
+    price = '' if price is None else str(price)
+
+    currency = DEFAULT_CURRENCY
+    for sign, code in CURRENCIES.items():
+        if sign in price.lower():
+            currency = code
+            break
+
+    # Точки по краям остаются от сокращений вроде "руб."
+    price_num = re.sub(r"[^\d,\.]", "", price).replace(',', '.').strip('.')
+    try:
+        return float(price_num), currency, True
+    except ValueError:
+        return None, currency, False
+
+def with_price_fields(item):
+    value, currency, ok = normalize_price(item.get('price'))
+    item['price_value'] = '' if value is None else value
+    item['currency'] = currency
+    item['price_ok'] = int(ok)
+    return item
+
+MergeResult = namedtuple('MergeResult', ['added', 'updated', 'written'])
+
+def normalize_rows(rows):
+    # Ступень конвейера между разбором страницы и записью: добавляет числовую цену
+    for item in rows:
+        yield with_price_fields(dict(item))
+
+def update_or_add_products(new_data, filename, key_field='title'):
+    """Сливает новые строки с файлом по ключу key_field.
+
+    new_data может быть генератором. Возвращает MergeResult: ключи добавленных
+    и изменённых строк и признак, что файл был перезаписан. Если ничего
+    не изменилось, файл не переписывается.
+    """
+    with CatalogSink(filename, key_field) as sink:
+        sink.extend(normalize_rows(new_data))
+        return sink.commit()
+
+class CatalogSink:
+    """Потоковая запись каталога.
+
+    Строки складываются по мере разбора во временную базу SQLite на диске,
+    там же лежат индекс ключей и ключи старого файла. commit() за один проход
+    по старому CSV пишет новый, поэтому память не растёт вместе с размером
+    каталога; растут только списки ключей добавленных и изменённых строк,
+    которые он возвращает. Строки должны пройти через normalize_rows.
+    """
+
+    def __init__(self, filename, key_field='title'):
+        self.filename = filename
+        self.key_field = key_field
+        self.count = 0
+        self._fields = []
+        # Пустое имя — временная база на диске, она удаляется при закрытии.
+        # merged — строка уже слита со старым файлом
+        self._db = sqlite3.connect("")
+        self._db.executescript(
+            "CREATE TABLE rows (key TEXT PRIMARY KEY, seq INTEGER, data TEXT, merged INTEGER DEFAULT 0);"
+            "CREATE TABLE old_keys (key TEXT PRIMARY KEY);"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.discard()
+
+    def write(self, item):
+        for name in item:
+            if name not in self._fields:
+                self._fields.append(name)
+        # Повтор ключа: побеждает последняя строка, место остаётся за первой
+        self._db.execute(
+            "INSERT INTO rows (key, seq, data) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET data = excluded.data",
+            (item[self.key_field], self.count, json.dumps(item, ensure_ascii=False)),
+        )
+        self.count += 1
+
+    def extend(self, rows):
+        for item in rows:
+            self.write(item)
+
+    def discard(self):
+        self._db.close()
+
+    def _new_rows(self, keys=None):
+        # Ещё не слитые строки в порядке первого появления
+        for key, data in self._db.execute("SELECT key, data FROM rows WHERE merged = 0 ORDER BY seq"):
+            if keys is not None:
+                keys.append(key)
+            yield json.loads(data)
+
+    def commit(self):
+        if not self.count:
+            print("Нет новых данных для обновления.")
+            return MergeResult([], [], False)
+
+        with file_lock(self.filename):
+            if not os.path.exists(self.filename):
+                added = []
+                _write_rows_atomic(self.filename, self._fields, self._new_rows(added))
+                print(f"Файл {self.filename} создан и сохранено {len(added)} записей")
+                return MergeResult(added, [], True)
+            return self._merge()
+
+    def _merge(self):
+        key_field = self.key_field
+        added = []
+        updated = []
+        db = self._db
+
+        def merged_rows(reader):
+            for old_item in reader:
+                key = old_item[key_field]
+                new = db.execute("SELECT data, merged FROM rows WHERE key = ?", (key,)).fetchone()
+                if new is None:
+                    # Повторы ключей в старом файле схлопываем
+                    if not db.execute("INSERT OR IGNORE INTO old_keys VALUES (?)", (key,)).rowcount:
+                        continue
+                elif new[1]:
+                    continue
+                else:
+                    db.execute("UPDATE rows SET merged = 1 WHERE key = ?", (key,))
+                    new_item = json.loads(new[0])
+                    # Сравниваем только данные с сайта, ценовые колонки из них вычисляются
+                    changed = {
+                        name: value for name, value in new_item.items()
+                        if name not in PRICE_FIELDS and str(value) != old_item.get(name, '')
+                    }
+                    if changed:
+                        old_item.update(changed)
+                        with_price_fields(old_item)
+                        updated.append(key)
+                # Строки из старого формата без ценовых колонок дополняем при перезаписи
+                yield old_item if old_item.get('price_value') is not None else with_price_fields(old_item)
+
+            yield from self._new_rows(added)
+
+        with open(self.filename, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            existing_fields = reader.fieldnames or []
+            fieldnames = _merge_fieldnames(existing_fields, self._fields)
+            # Пока не ясно, есть ли изменения, пишем во временный файл рядом
+            tmp_path = _write_rows_tmp(self.filename, fieldnames, merged_rows(reader))
+
+        if not added and not updated and fieldnames == existing_fields:
+            # Файл не трогаем: время проверки записывает freshness, а новый
+            # mtime сбросил бы кэш каталога и найденных позиций
+            os.unlink(tmp_path)
+            print(f"Изменений нет, файл {self.filename} не перезаписан")
+            return MergeResult([], [], False)
+
+        os.replace(tmp_path, self.filename)
+        write_catalog_copy(self.filename)
+        print(f"Обновлено записей: {len(updated)}, добавлено новых: {len(added)}")
+        return MergeResult(added, updated, True)
+
+def _write_rows_tmp(filename, fieldnames, rows):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filename) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, restval='')
             writer.writeheader()
-            writer.writerows(new_data)
-        print(f"Файл {filename} создан и сохранено {len(new_data)} записей")
-        return
-
-    with open(filename, 'r', encoding='utf-8-sig', newline='') as f:
-        reader = csv.DictReader(f)
-        existing = list(reader)
-
-    key_field = 'title'
-    existing_dict = {item[key_field]: item for item in existing}
-
-    updated_count = 0
-    added_count = 0
-
-    for new_item in new_data:
-        key = new_item[key_field]
-        if key in existing_dict:
-            if existing_dict[key]['price'] != new_item['price']:
-                existing_dict[key]['price'] = new_item['price']
-                updated_count += 1
-        else:
-            existing_dict[key] = new_item
-            added_count += 1
-
-    with open(filename, 'w', encoding='utf-8-sig', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=new_data[0].keys())
-        writer.writeheader()
-        writer.writerows(existing_dict.values())
-
-    print(f"Обновлено записей: {updated_count}, добавлено новых: {added_count}")
\ No newline at end of file
+            writer.writerows(rows)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+def _write_rows_atomic(filename, fieldnames, rows):
+    # Пишем во временный файл рядом и подменяем одним rename:
+    # читатели видят либо старый, либо новый файл целиком
+    os.replace(_write_rows_tmp(filename, fieldnames, rows), filename)
+    write_catalog_copy(filename)
+
+def _merge_fieldnames(*groups):
+    # Объединение колонок с сохранением порядка: у Invitro есть description, у Helix нет
+    fieldnames = []
+    for group in groups:
+        for name in group:
+            if name not in fieldnames:
+                fieldnames.append(name)
+    return fieldnames